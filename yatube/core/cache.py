@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.http import HttpRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe, quote_etag
+
+from . import timing
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; отсутствующие теги получают новую версию."""
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {
+        key: uuid.uuid4().hex[:8] for key in keys if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate_tags(*tags):
+    """
+    Сбрасывает теги.
+
+    Внутри транзакции теги сбрасываются ещё раз после коммита, чтобы
+    страница, собранная до коммита, не закэшировалась под новой версией.
+    """
+    keys = [_tag_key(tag) for tag in set(tags)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def page_key(request):
+    url = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    user = request.user.pk if request.user.is_authenticated else 0
+    return f'page:{request.method}:{url}:{user}'
+
+
+def page_etag(key, versions):
+    """ETag страницы с ключом key, собранной при версиях тегов versions."""
+    return quote_etag(
+        hashlib.md5(f'{key}:{".".join(versions)}'.encode()).hexdigest()
+    )
+
+
+def _conditional(request, response):
+    """304 по ETag или Last-Modified самого ответа."""
+    patch_cache_control(response, no_cache=True)
+    if response.status_code != 200 or not response.has_header('ETag'):
+        return response
+    return get_conditional_response(
+        request,
+        etag=response.get('ETag'),
+        last_modified=parse_http_date_safe(response.get('Last-Modified')),
+        response=response
+    )
+
+
+def _store(key, versions, response):
+    cache.set(
+        key,
+        {
+            'versions': versions,
+            'response': response,
+            'fresh_until': time.time() + settings.PAGE_CACHE_TIMEOUT,
+        },
+        settings.PAGE_CACHE_HARD_TIMEOUT
+    )
+
+
+def _render(view, request, args, kwargs, key, versions):
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200 and not response.streaming:
+        # ETag - версий, с которыми страница собрана: устаревшая копия,
+        # отданная во время пересборки, не выдаст себя за свежую.
+        response['ETag'] = page_etag(key, versions)
+        _store(key, versions, response)
+    return response
+
+
+def _detached(request):
+    """
+    Копия анонимного запроса для пересборки в фоне.
+
+    Исходный запрос к этому времени уже отдан: его сессия, пользователь
+    и состояние middleware в потоке не используются.
+    """
+    copy = HttpRequest()
+    copy.method = 'GET'
+    copy.path = request.path
+    copy.path_info = request.path_info
+    copy.GET = request.GET.copy()
+    copy.META = {
+        name: value for name, value in request.META.items()
+        if isinstance(value, str)
+    }
+    copy.resolver_match = request.resolver_match
+    copy.user = AnonymousUser()
+    return copy
+
+
+def _refresh(view, request, args, kwargs, key, versions, lock):
+    try:
+        _render(view, request, args, kwargs, key, versions)
+    finally:
+        cache.delete(lock)
+        connection.close()
+
+
+def _wait_for(key, versions):
+    deadline = time.time() + settings.PAGE_CACHE_LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry['versions'] == versions:
+            return entry['response']
+    return None
+
+
+def cache_tagged(tags):
+    """
+    Кэширует страницу до сброса любого из её тегов.
+
+    tags - функция, которая по аргументам view возвращает список тегов.
+    Страница кэшируется отдельно для каждого пользователя. Запись живёт
+    PAGE_CACHE_HARD_TIMEOUT, но свежей считается PAGE_CACHE_TIMEOUT:
+    устаревшую (или сброшенную тегом) страницу пересобирает один запрос,
+    взявший блокировку, а остальные в это время получают старую копию.
+
+    Страница получает ETag по версиям тегов, и с If-None-Match
+    текущих версий браузер или прокси получат 304 без чтения кэша
+    страниц и без запросов к базе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = tag_versions(tags(request, *args, **kwargs))
+            key = page_key(request)
+            not_modified = get_conditional_response(
+                request, etag=page_etag(key, versions)
+            )
+            if not_modified is not None:
+                timing.cache_lookup(hits=1, misses=0)
+                patch_cache_control(not_modified, no_cache=True)
+                return not_modified
+            return _conditional(
+                request, _cached(view, request, args, kwargs, key, versions)
+            )
+        return wrapper
+    return decorator
+
+
+def _cached(view, request, args, kwargs, key, versions):
+    entry = cache.get(key)
+    if (
+        entry is not None
+        and entry['versions'] == versions
+        and entry['fresh_until'] > time.time()
+    ):
+        timing.cache_lookup(hits=1, misses=0)
+        return entry['response']
+    timing.cache_lookup(hits=0, misses=1)
+    lock = f'{key}:lock'
+    if not cache.add(lock, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+        if entry is not None:
+            return entry['response']
+        response = _wait_for(key, versions)
+        if response is not None:
+            return response
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = page_etag(key, versions)
+        return response
+    if (
+        entry is not None
+        and settings.PAGE_CACHE_BACKGROUND_REFRESH
+        and not request.user.is_authenticated
+    ):
+        threading.Thread(
+            target=_refresh,
+            args=(
+                view, _detached(request), args, kwargs, key, versions, lock
+            ),
+            daemon=True,
+        ).start()
+        return entry['response']
+    try:
+        return _render(view, request, args, kwargs, key, versions)
+    finally:
+        cache.delete(lock)
@@ -0,0 +1,269 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats (id, entries, size) VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats
+    SET entries = entries + 1, size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats
+    SET entries = entries - 1, size = size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_stats SET size = size - OLD.size + NEW.size;
+END;
+'''
+
+UPSERT = '''
+INSERT INTO cache (key, value, expires, accessed, size)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value,
+    expires = excluded.expires,
+    accessed = excluded.accessed,
+    size = excluded.size
+'''
+
+
+class SQLiteCache(BaseCache):
+    """
+    Кэш в файле SQLite (WAL), общий для всех процессов на хосте.
+
+    LOCATION - путь к файлу базы. Кроме MAX_ENTRIES принимает опцию
+    MAX_SIZE - предельный суммарный размер значений в байтах. При
+    превышении лимитов удаляются давно не читавшиеся записи (LRU).
+    Время чтения обновляется не чаще раза в ACCESS_RESOLUTION секунд,
+    чтобы get не превращался в запись.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._access_resolution = float(
+            options.get('ACCESS_RESOLUTION', 1)
+        )
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._local.db = db
+            self._local.pid = pid
+        return self._local.db
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                UPSERT + ' WHERE cache.expires IS NOT NULL'
+                ' AND cache.expires <= ?',
+                (key, data, self.get_backend_timeout(timeout), now,
+                 len(data), now)
+            )
+            added = cursor.rowcount > 0
+            if added:
+                self._cull(db, now)
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        values = self._get_many([key])
+        return values.get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                'UPDATE cache SET expires = ?, accessed = ? WHERE key = ?'
+                ' AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), now, key, now)
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            cursor = db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        return {
+            keys[key]: value
+            for key, value in self._get_many(list(keys)).items()
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append(
+                (self._key(key, version), value, expires, now, len(value))
+            )
+        with self._transaction() as db:
+            db.executemany(UPSERT, rows)
+            self._cull(db, now)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as db:
+            db.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ?'
+                ' AND (expires IS NULL OR expires > ?)',
+                (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ?'
+                ' WHERE key = ?',
+                (data, len(data), now, key)
+            )
+        return value
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт весь процесс: открывать его на каждый запрос
+        # дороже, чем держать.
+        pass
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, accessed FROM cache WHERE key IN (%s)'
+            ' AND (expires IS NULL OR expires > ?)'
+            % ', '.join('?' * len(keys)),
+            (*keys, now)
+        ).fetchall()
+        touched = [
+            (now, key) for key, _, accessed in rows
+            if now - accessed > self._access_resolution
+        ]
+        if touched:
+            with self._transaction() as db:
+                db.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?', touched
+                )
+        return {key: pickle.loads(value) for key, value, _ in rows}
+
+    def _cull(self, db, now):
+        entries, size = db.execute(
+            'SELECT entries, size FROM cache_stats'
+        ).fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        entries, size = db.execute(
+            'SELECT entries, size FROM cache_stats'
+        ).fetchone()
+        if entries > self._max_entries:
+            # Как и встроенные бэкенды, чистим с запасом: 1/CULL_FREQUENCY
+            # записей, чтобы не вытеснять по одной на каждый set.
+            excess = entries - self._max_entries
+            excess += self._max_entries // max(self._cull_frequency, 1)
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (excess,)
+            )
+        while size > self._max_size:
+            victims = []
+            for key, row_size in db.execute(
+                'SELECT key, size FROM cache ORDER BY accessed LIMIT 100'
+            ).fetchall():
+                victims.append((key,))
+                size -= row_size
+                if size <= self._max_size:
+                    break
+            if not victims:
+                break
+            db.executemany('DELETE FROM cache WHERE key = ?', victims)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE: запись блокирует базу сразу, без гонок upgrade."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Кэши, которые видит только свой процесс.
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+# Дольше этого страница процесса, не видевшего сброс тега, устаревает
+# заметно для пользователя.
+LOCAL_PAGE_CACHE_TIMEOUT = 20
+
+
+def is_process_local(alias='default'):
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_page_cache(app_configs, **kwargs):
+    if not is_process_local() or (
+        settings.PAGE_CACHE_TIMEOUT <= LOCAL_PAGE_CACHE_TIMEOUT
+    ):
+        return []
+    return [Warning(
+        'Кэш default виден только своему процессу: сброс тегов не дойдёт '
+        'до других воркеров, и они будут отдавать старые страницы '
+        f'до PAGE_CACHE_TIMEOUT = {settings.PAGE_CACHE_TIMEOUT} секунд.',
+        hint='Используйте общий кэш (core.cache_backends.SQLiteCache, '
+             f'Redis) или PAGE_CACHE_TIMEOUT <= {LOCAL_PAGE_CACHE_TIMEOUT}.',
+        id='core.W001',
+    )]
@@ -0,0 +1,240 @@
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Границы корзин гистограмм; последняя корзина (+Inf) - неявная.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# имя -> (тип, описание, границы корзин для гистограмм)
+METRICS = {
+    'yatube_request_duration_seconds': (
+        'histogram', 'Request latency by URL name.', LATENCY_BUCKETS
+    ),
+    'yatube_request_db_queries': (
+        'histogram', 'SQL queries per request by URL name.', QUERY_BUCKETS
+    ),
+    'yatube_requests_total': (
+        'counter', 'Requests by URL name and status.', None
+    ),
+    'yatube_cache_hits_total': (
+        'counter', 'Page and post card cache hits by URL name.', None
+    ),
+    'yatube_cache_misses_total': (
+        'counter', 'Page and post card cache misses by URL name.', None
+    ),
+}
+
+# счётчик core.timing -> метрика
+CACHE_COUNTS = (
+    ('cache.hit', 'yatube_cache_hits_total'),
+    ('cache.miss', 'yatube_cache_misses_total'),
+)
+
+_collectors = []
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+class Registry:
+    """
+    Счётчики и гистограммы одного процесса.
+
+    Процесс раз в METRICS_FLUSH_INTERVAL секунд сбрасывает всё накопленное
+    в свой файл <pid>.json каталога directory, а /metrics складывает
+    файлы всех процессов. Файлы завершившихся процессов остаются, чтобы
+    счётчики не уменьшались; процесс, получивший тот же pid, продолжает
+    с его значений.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.path = os.path.join(self.directory, f'{self.pid}.json')
+        self.flushed = 0
+        self.values = read_file(self.path)
+
+    def inc(self, name, labels, amount=1):
+        self._update(name, labels, lambda value: (value or 0) + amount)
+
+    def observe(self, name, labels, value):
+        bucket = bisect_left(METRICS[name][2], value)
+
+        def update(histogram):
+            histogram = histogram or [0] * (len(METRICS[name][2]) + 2)
+            histogram[bucket] += 1
+            histogram[-1] += value
+            return histogram
+        self._update(name, labels, update)
+
+    def _update(self, name, labels, update):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if os.getpid() != self.pid:
+                # Воркер форкнулся от процесса, уже писавшего метрики.
+                self._start()
+            self.values[key] = update(self.values.get(key))
+            interval = settings.METRICS_FLUSH_INTERVAL
+            if time.monotonic() - self.flushed > interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.flushed = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        data = [
+            [name, dict(labels), value]
+            for (name, labels), value in self.values.items()
+        ]
+        # Запись во временный файл и rename: читатель не увидит половину.
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp, self.path)
+
+    def collect(self):
+        """Сумма метрик всех процессов, включая ещё не сброшенные свои."""
+        self.flush()
+        total = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, filename)
+            for key, value in read_file(path).items():
+                if key not in total:
+                    total[key] = value
+                elif isinstance(value, list):
+                    total[key] = [a + b for a, b in zip(total[key], value)]
+                else:
+                    total[key] += value
+        return total
+
+
+def read_file(path):
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return {
+        (name, tuple(sorted(labels.items()))): value
+        for name, labels, value in data
+    }
+
+
+def registry():
+    """Реестр текущего процесса для каталога METRICS_DIR."""
+    directory = settings.METRICS_DIR
+    if directory not in _registries:
+        with _registries_lock:
+            _registries.setdefault(directory, Registry(directory))
+    return _registries[directory]
+
+
+def collector(func):
+    """
+    Регистрирует функцию, которая считает метрики в момент запроса /metrics.
+
+    Функция возвращает список (имя, тип, описание, [(метки, значение)]) -
+    так отдаются величины вроде длины очереди, которые незачем копить
+    в каждом процессе.
+    """
+    _collectors.append(func)
+    return func
+
+
+def observe_request(view, status, timings):
+    """Записывает запрос по замерам core.timing."""
+    metrics = registry()
+    labels = {'view': view}
+    metrics.observe(
+        'yatube_request_duration_seconds', labels, timings.durations['total']
+    )
+    metrics.observe(
+        'yatube_request_db_queries', labels, timings.counts.get('db', 0)
+    )
+    metrics.inc('yatube_requests_total', {'view': view, 'status': status})
+    for count, name in CACHE_COUNTS:
+        if timings.counts.get(count):
+            metrics.inc(name, labels, timings.counts[count])
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace(
+            '"', r'\"'
+        ).replace('\n', r'\n'))
+        for key, value in pairs
+    ) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _families(values):
+    families = {}
+    for (name, labels), value in sorted(values.items()):
+        families.setdefault(name, []).append((labels, value))
+    hits = sum(
+        value for (name, _), value in values.items()
+        if name == 'yatube_cache_hits_total'
+    )
+    lookups = hits + sum(
+        value for (name, _), value in values.items()
+        if name == 'yatube_cache_misses_total'
+    )
+    yield 'yatube_cache_hit_ratio', 'gauge', (
+        'Share of cache lookups that were hits.'
+    ), [((), hits / lookups if lookups else 0.0)]
+    for name, (kind, description, _) in METRICS.items():
+        if name in families:
+            yield name, kind, description, families[name]
+    for func in _collectors:
+        for name, kind, description, samples in func():
+            yield name, kind, description, [
+                (tuple(sorted(labels.items())), value)
+                for labels, value in samples
+            ]
+
+
+def render(values):
+    """Метрики в текстовом формате Prometheus 0.0.4."""
+    lines = []
+    for name, kind, description, samples in _families(values):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            bounds = METRICS[name][2] + (math.inf,)
+            for bound, number in zip(bounds, value):
+                cumulative += number
+                lines.append('{}_bucket{} {}'.format(
+                    name, _labels(labels, le=_number(bound)), cumulative
+                ))
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
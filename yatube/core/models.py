@@ -1,12 +1,22 @@
-from django.db import models
+from django.db import models, transaction
 
 
 class CreatedModel(models.Model):
-    """Абстрактная модель. Добавляет дату создания."""
+    """Абстрактная модель. Добавляет даты создания и изменения."""
     pub_date = models.DateTimeField(
         verbose_name='Дата создания',
         auto_now_add=True
     )
+    # update() его не трогает: правки через update() ставят его сами.
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         abstract = True
+
+    def save(self, *args, **kwargs):
+        """Сохраняет запись и выполняет post_save в одной транзакции."""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
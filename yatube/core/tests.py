@@ -1,5 +1,23 @@
+import os
+import shutil
+import tempfile
+import threading
 from http import HTTPStatus
-from django.test import TestCase
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import metrics, timing
+from .cache import cache_tagged, invalidate_tags, page_key
+from .cache_backends import SQLiteCache
+from .checks import check_page_cache
 
 
 class ViewTestClass(TestCase):
@@ -7,3 +25,244 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_header_and_log(self):
+        """Замеры запроса уходят в Server-Timing и в лог с именем URL"""
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('posts:index'))
+            query_count = len(queries)
+            self.client.get(reverse('posts:index'))
+        header = response['Server-Timing']
+        for metric in ('db;dur=', 'template;dur=', 'cache;desc=', 'total;'):
+            self.assertIn(metric, header)
+        first, second = [record.timing for record in logs.records]
+        self.assertIn('view=posts:index', logs.output[0])
+        self.assertEqual(first['db_queries'], query_count)
+        self.assertGreater(first['cache_misses'], 0)
+        self.assertEqual(second['cache_hits'], 1)
+        self.assertEqual(second['template_ms'], 0)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_disabled(self):
+        with self.assertLogs('core.timing', 'INFO'):
+            response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_nested_measure(self):
+        """Вложенный замер не удваивает время, вне запроса замеров нет"""
+        with timing.measure('template'):
+            timing.count('db')
+        self.assertIsNone(timing.current())
+        timings = timing.Timings()
+        token = timing._current.set(timings)
+        try:
+            with timing.measure('template'):
+                with timing.measure('template'):
+                    pass
+            timing.count('db', 2)
+        finally:
+            timing._current.reset(token)
+        self.assertEqual(timings.counts, {'template': 1, 'db': 2})
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(METRICS_DIR=self.directory)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_processes_are_summed(self):
+        """Метрики файлов всех процессов складываются"""
+        own = metrics.Registry(self.directory)
+        other = metrics.Registry(self.directory)
+        other.path = os.path.join(self.directory, '1.json')
+        for registry in (own, other):
+            registry.inc('yatube_cache_hits_total', {'view': 'posts:index'})
+            registry.observe(
+                'yatube_request_db_queries', {'view': 'posts:index'}, 3
+            )
+        own.inc('yatube_cache_misses_total', {'view': 'posts:index'}, 2)
+        other.flush()
+        text = metrics.render(own.collect())
+        for line in (
+            'yatube_cache_hits_total{view="posts:index"} 2',
+            'yatube_cache_hit_ratio 0.5',
+            'yatube_request_db_queries_bucket{view="posts:index",le="2"} 0',
+            'yatube_request_db_queries_bucket{view="posts:index",le="5"} 2',
+            'yatube_request_db_queries_bucket{view="posts:index",le="+Inf"} 2',
+            'yatube_request_db_queries_sum{view="posts:index"} 6',
+        ):
+            self.assertIn(line + '\n', text)
+        self.assertEqual(
+            metrics.Registry(self.directory).values, own.values
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint(self):
+        """/metrics видят только сотрудники и Prometheus с токеном"""
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            self.client.get(reverse('metrics')).status_code,
+            HTTPStatus.FORBIDDEN
+        )
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        )
+        text = response.content.decode()
+        self.assertIn(
+            'yatube_requests_total{status="200",view="posts:index"} 1\n', text
+        )
+        self.assertIn(
+            'yatube_thumbnail_queue_depth{status="pending"} 0\n', text
+        )
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram', text)
+        staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('status="403",view="metrics"', response.content.decode())
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.request = RequestFactory().get('/cached/')
+        self.request.user = AnonymousUser()
+
+        @cache_tagged(lambda request: ['test'])
+        def view(request):
+            self.calls += 1
+            return HttpResponse(str(self.calls))
+
+        self.view = view
+
+    def test_fresh_page_is_cached(self):
+        self.assertEqual(self.view(self.request).content, b'1')
+        self.assertEqual(self.view(self.request).content, b'1')
+        invalidate_tags('test')
+        self.assertEqual(self.view(self.request).content, b'2')
+
+    def test_stale_page_served_while_locked(self):
+        self.view(self.request)
+        invalidate_tags('test')
+        cache.add(page_key(self.request) + ':lock', 1)
+        self.assertEqual(self.view(self.request).content, b'1')
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=-1)
+    def test_soft_expired_page_rebuilt(self):
+        self.view(self.request)
+        self.assertEqual(self.view(self.request).content, b'2')
+        self.assertIsNone(cache.get(page_key(self.request) + ':lock'))
+
+    @override_settings(
+        PAGE_CACHE_TIMEOUT=-1, PAGE_CACHE_BACKGROUND_REFRESH=True
+    )
+    def test_background_refresh_detached(self):
+        """Фоновая пересборка - только анонимных страниц и по копии запроса"""
+        requests = []
+
+        @cache_tagged(lambda request: ['test'])
+        def view(request):
+            requests.append(request)
+            return HttpResponse(str(len(requests)))
+
+        view(self.request)
+        threads, real_thread = [], threading.Thread
+
+        def thread(*args, **kwargs):
+            threads.append(real_thread(*args, **kwargs))
+            return threads[-1]
+
+        with mock.patch('core.cache.threading.Thread', side_effect=thread):
+            self.assertEqual(view(self.request).content, b'1')
+        threads[0].join()
+        self.assertIsNot(requests[-1], self.request)
+        self.assertEqual(requests[-1].get_full_path(), '/cached/')
+        self.assertFalse(requests[-1].user.is_authenticated)
+        user = get_user_model().objects.create_user(username='reader')
+        request = RequestFactory().get('/cached/')
+        request.user = user
+        view(request)
+        with mock.patch('core.cache.threading.Thread') as thread:
+            self.assertEqual(view(request).content, b'4')
+        thread.assert_not_called()
+
+
+class CacheChecksTests(TestCase):
+    def test_process_local_page_cache(self):
+        """Долгий кэш страниц в LocMemCache - предупреждение"""
+        self.assertEqual(check_page_cache(None), [])
+        local = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}
+        with override_settings(CACHES=local):
+            self.assertEqual(
+                [error.id for error in check_page_cache(None)], ['core.W001']
+            )
+            with override_settings(PAGE_CACHE_TIMEOUT=20):
+                self.assertEqual(check_page_cache(None), [])
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': {'MAX_ENTRIES': 10, 'MAX_SIZE': 10000}}
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertTrue(self.cache.add('other', 2))
+        self.assertEqual(self.cache.incr('other', 3), 5)
+        self.assertEqual(
+            self.cache.get_many(['key', 'other', 'missing']),
+            {'key': {'value': 1}, 'other': 5}
+        )
+        self.cache.delete_many(['key', 'other'])
+        self.assertIsNone(self.cache.get('key'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expired_key_can_be_added(self):
+        self.cache.set('key', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 2)
+
+    def test_lru_eviction(self):
+        self.cache.set('hot', 1)
+        self.cache.set_many({f'key{i}': i for i in range(9)})
+        self.cache._local.db.execute(
+            "UPDATE cache SET accessed = accessed + 100 WHERE key LIKE '%hot'"
+        )
+        self.cache.set('new', 1)
+        self.assertEqual(self.cache.get('hot'), 1)
+        self.assertEqual(self.cache.get('new'), 1)
+        self.assertIsNone(self.cache.get('key0'))
+
+    def test_size_limit(self):
+        self.cache.set('big', b'x' * 6000)
+        self.cache.set('bigger', b'x' * 6000)
+        self.assertIsNone(self.cache.get('big'))
+        self.assertIsNotNone(self.cache.get('bigger'))
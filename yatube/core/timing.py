@@ -0,0 +1,162 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends import django as django_backend
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('timings', default=None)
+
+
+class Timings:
+    """Замеры одного запроса: суммарные длительности и счётчики по имени."""
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        self.active = set()
+
+    def add(self, name, duration=0.0, count=1):
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+        self.counts[name] = self.counts.get(name, 0) + count
+
+
+def current():
+    """Замеры текущего запроса; вне запроса (команды, потоки) - None."""
+    return _current.get()
+
+
+@contextmanager
+def measure(name):
+    """
+    Засекает блок под именем name.
+
+    Вложенный замер того же имени не считается второй раз: шаблон,
+    который рендерит шаблон, - это один рендер.
+    """
+    timings = _current.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.add(name, time.perf_counter() - started)
+
+
+def count(name, number=1):
+    timings = _current.get()
+    if timings is not None and number:
+        timings.add(name, count=number)
+
+
+def cache_lookup(hits, misses):
+    count('cache.hit', hits)
+    count('cache.miss', misses)
+
+
+def _execute(execute, sql, params, many, context):
+    with measure('db'):
+        return execute(sql, params, many, context)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with measure('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Бэкенд шаблонов Django, который засекает рендер."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return Template(template.template, self)
+
+
+class ServerTimingMiddleware:
+    """
+    Замеряет запрос: SQL, рендер шаблонов, кэш, миниатюры и всё время.
+
+    Замеры уходят в заголовок Server-Timing (если включён
+    SERVER_TIMING_HEADER), строкой в лог core.timing с именем URL
+    (поля строки есть и в extra['timing'] для структурных форматтеров)
+    и в метрики core.metrics.
+    На запрос - несколько вызовов perf_counter на каждый SQL-запрос.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = Timings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timings.durations['total'] = time.perf_counter() - started
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = server_timing(timings)
+        match = request.resolver_match
+        view = match.view_name if match else '-'
+        log(request, view, response, timings)
+        metrics.observe_request(view, response.status_code, timings)
+        return response
+
+
+def server_timing(timings):
+    ms = {
+        name: round(duration * 1000, 1)
+        for name, duration in timings.durations.items()
+    }
+    metrics = [
+        f'db;dur={ms.get("db", 0)};desc="{timings.counts.get("db", 0)} SQL"'
+    ]
+    for name in ('template', 'thumbnail'):
+        if name in ms:
+            metrics.append(f'{name};dur={ms[name]}')
+    hits = timings.counts.get('cache.hit', 0)
+    misses = timings.counts.get('cache.miss', 0)
+    if hits or misses:
+        metrics.append(f'cache;desc="hit={hits} miss={misses}"')
+    metrics.append(f'total;dur={ms["total"]}')
+    return ', '.join(metrics)
+
+
+def log(request, view, response, timings):
+    fields = {
+        'view': view,
+        'method': request.method,
+        'status': response.status_code,
+        'total_ms': round(timings.durations['total'] * 1000, 1),
+        'db_queries': timings.counts.get('db', 0),
+        'db_ms': round(timings.durations.get('db', 0) * 1000, 1),
+        'template_ms': round(timings.durations.get('template', 0) * 1000, 1),
+        'thumbnail_ms': round(
+            timings.durations.get('thumbnail', 0) * 1000, 1
+        ),
+        'cache_hits': timings.counts.get('cache.hit', 0),
+        'cache_misses': timings.counts.get('cache.miss', 0),
+    }
+    logger.info(
+        ' '.join(f'{name}=%({name})s' for name in fields),
+        fields,
+        extra={'timing': fields}
+    )
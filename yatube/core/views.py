@@ -1,4 +1,10 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics as registry
 
 
 def page_not_found(request, exception):
@@ -15,3 +21,16 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def metrics(request):
+    """Метрики всех процессов для Prometheus: сотрудникам или по токену."""
+    token = settings.METRICS_TOKEN
+    if not request.user.is_staff and not (token and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    )):
+        raise PermissionDenied
+    return HttpResponse(
+        registry.render(registry.registry().collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
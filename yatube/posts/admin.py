@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 from .models import Post, Follow
 from .models import Group, Comment
+from . import search
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,8 +12,25 @@ class PostAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
     list_editable = ('group',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE '%...%'."""
+        match = search.match_expression(search_term)
+        if not match or not search.installed():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(
+            pk__in=RawSQL(search.MATCH_IDS, [match])
+        ), False
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'text', 'pub_date', 'author', 'post')
+    # Выпадающий список всех комментариев для parent был бы огромным.
+    raw_id_fields = ('post', 'author', 'parent')
+
 
 admin.site.register(Group)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Follow)
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
@@ -0,0 +1,170 @@
+import hashlib
+from functools import wraps
+from http import HTTPStatus
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import cards
+from .models import FeedItem, Group, Post, User
+from .pagination import CursorPaginator
+from .storage import image_storage
+
+# Меняется вместе с форматом ответа, чтобы старые ETag не совпали.
+VERSION = 'v1'
+# Поля ответа; в ленте к ним ведёт префикс 'post__'.
+POST_FIELDS = (
+    'text', 'author__username', 'group__slug', 'image', 'image_width',
+    'image_height', 'comment_count',
+)
+# Поля для ETag: только ключи версий из кэша.
+ETAG_FIELDS = ('author_id', 'group_id')
+
+
+def serialize_post(row, id_field='id', prefix=''):
+    """Пост из словаря .values() - без экземпляров моделей."""
+    image = row[prefix + 'image']
+    return {
+        'id': row[id_field],
+        'text': row[prefix + 'text'],
+        'pub_date': row['pub_date'],
+        'author': row[prefix + 'author__username'],
+        'group': row[prefix + 'group__slug'],
+        'image': {
+            'url': image_storage.url(image),
+            'width': row[prefix + 'image_width'],
+            'height': row[prefix + 'image_height'],
+        } if image else None,
+        'comment_count': row[prefix + 'comment_count'],
+    }
+
+
+def page_etag(rows, id_field='id', prefix='', cursors=()):
+    """
+    Сильный ETag: id постов, max(pub_date) и версии из кэша.
+
+    Версии поста, автора, группы и комментариев меняют сигналы -
+    так ETag видит правки, которых не видно по датам.
+    """
+    versions = cards.get_versions({
+        pair for row in rows for pair in (
+            ('post', row[id_field]),
+            ('user', row[prefix + 'author_id']),
+            ('group', row[prefix + 'group_id']),
+            ('comments', row[id_field]),
+        )
+    })
+    digest = hashlib.sha1(VERSION.encode())
+    if rows:
+        latest = max(row['pub_date'] for row in rows)
+        digest.update(latest.isoformat().encode())
+    for row in rows:
+        digest.update('|{}:{}.{}.{}.{}'.format(
+            row[id_field],
+            versions['post', row[id_field]],
+            versions['user', row[prefix + 'author_id']],
+            versions['group', row[prefix + 'group_id']],
+            versions['comments', row[id_field]],
+        ).encode())
+    for cursor in cursors:
+        digest.update(f'|{cursor}'.encode())
+    return digest.hexdigest()
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {'detail': 'Нужна авторизация.'},
+                status=HTTPStatus.UNAUTHORIZED
+            )
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def post_list(posts, exists=None, id_field='id', prefix=''):
+    """
+    View списка постов с курсором ?after=/?before=.
+
+    posts(request, **kwargs) - queryset постов или записей ленты,
+    exists(**kwargs) проверяет владельца списка, только если страница
+    пуста; в ETag тоже, иначе пустая страница удалённой группы отдала
+    бы 304 вместо 404. 304 стоит одного запроса по индексу за id и датами
+    страницы.
+    """
+    def get_page(request, fields, **kwargs):
+        return CursorPaginator(
+            posts(request, **kwargs).values(
+                id_field, 'pub_date', *(prefix + field for field in fields)
+            ),
+            settings.POSTS_PER_PAGE,
+            id_field=id_field
+        ).get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before')
+        )
+
+    def etag(request, **kwargs):
+        page_obj = get_page(request, ETAG_FIELDS, **kwargs)
+        if not page_obj.object_list and exists and not exists(**kwargs):
+            return None
+        return page_etag(
+            page_obj.object_list, id_field, prefix,
+            [page_obj.next_cursor, page_obj.previous_cursor]
+        )
+
+    @cache_control(private=True, no_cache=True)
+    @condition(etag_func=etag)
+    def view(request, **kwargs):
+        page_obj = get_page(request, POST_FIELDS, **kwargs)
+        if not page_obj.object_list and exists and not exists(**kwargs):
+            raise Http404
+        return JsonResponse({
+            'results': [
+                serialize_post(row, id_field, prefix) for row in page_obj
+            ],
+            'next': page_obj.next_cursor,
+            'previous': page_obj.previous_cursor,
+        }, json_dumps_params={'ensure_ascii': False})
+    return view
+
+
+index = post_list(lambda request: Post.objects.all())
+group_posts = post_list(
+    lambda request, slug: Post.objects.filter(group__slug=slug),
+    exists=lambda slug: Group.objects.filter(slug=slug).exists()
+)
+profile = post_list(
+    lambda request, username: Post.objects.filter(
+        author__username=username
+    ),
+    exists=lambda username: User.objects.filter(username=username).exists()
+)
+follow_index = api_login_required(post_list(
+    lambda request: FeedItem.objects.filter(user=request.user),
+    id_field='post_id',
+    prefix='post__'
+))
+
+
+def post_rows(post_id, fields):
+    return Post.objects.filter(pk=post_id).values('id', 'pub_date', *fields)
+
+
+def post_etag(request, post_id):
+    row = post_rows(post_id, ETAG_FIELDS).first()
+    return page_etag([row]) if row else None
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=post_etag)
+def post_detail(request, post_id):
+    row = post_rows(post_id, POST_FIELDS).first()
+    if row is None:
+        raise Http404
+    return JsonResponse(
+        serialize_post(row), json_dumps_params={'ensure_ascii': False}
+    )
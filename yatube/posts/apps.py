@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from core import metrics
+
+        from . import checks, signals  # noqa: F401
+        from .thumbnails import queue_metrics
+        metrics.collector(queue_metrics)
@@ -0,0 +1,232 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Group, User
+
+
+class PrefixIndex:
+    """
+    Строки, отсортированные по ключу casefold, с поиском по префиксу.
+
+    Поиск - bisect по списку ключей, изменение - вставка в список.
+    """
+
+    def __init__(self, values=()):
+        pairs = sorted((value.casefold(), value) for value in values)
+        self.keys = [key for key, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return self._find(value) is not None
+
+    def add(self, value):
+        if value in self:
+            return
+        position = bisect_left(self.keys, value.casefold())
+        self.keys.insert(position, value.casefold())
+        self.values.insert(position, value)
+
+    def discard(self, value):
+        position = self._find(value)
+        if position is not None:
+            del self.keys[position]
+            del self.values[position]
+
+    def search(self, prefix, limit):
+        prefix = prefix.casefold()
+        position = bisect_left(self.keys, prefix)
+        found = []
+        while (
+            position < len(self.keys) and len(found) < limit
+            and self.keys[position].startswith(prefix)
+        ):
+            found.append(self.values[position])
+            position += 1
+        return found
+
+    def _find(self, value):
+        key = value.casefold()
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.values[position] == value:
+                return position
+            position += 1
+        return None
+
+
+class CompactPrefixIndex:
+    """
+    PrefixIndex для очень большого числа строк.
+
+    Строки лежат в одном bytes через перевод строки, к ним - массив
+    смещений: несколько байт на запись вместо двух объектов str.
+    Изменения копятся в маленьком PrefixIndex и множестве удалённых
+    и вливаются в основной массив, когда их набирается merge_every.
+    """
+
+    def __init__(self, values=(), merge_every=1000):
+        self.merge_every = merge_every
+        self._build(sorted(values, key=str.casefold))
+
+    def __len__(self):
+        return len(self.offsets) - 1 - len(self.removed) + len(self.added)
+
+    def __contains__(self, value):
+        return value in self.added or (
+            value not in self.removed and self._find(value) is not None
+        )
+
+    def add(self, value):
+        self.removed.discard(value)
+        if self._find(value) is None:
+            self.added.add(value)
+            self._maybe_merge()
+
+    def discard(self, value):
+        self.added.discard(value)
+        if self._find(value) is not None:
+            self.removed.add(value)
+            self._maybe_merge()
+
+    def search(self, prefix, limit):
+        return list(heapq.merge(
+            self._search_base(prefix.casefold(), limit),
+            self.added.search(prefix, limit),
+            key=str.casefold
+        ))[:limit]
+
+    def _build(self, values):
+        encoded = [value.encode() for value in values]
+        self.data = b'\n'.join(encoded) + b'\n'
+        self.offsets = array('Q', [0])
+        self.offsets.extend(accumulate(len(value) + 1 for value in encoded))
+        self.added = PrefixIndex()
+        self.removed = set()
+
+    def _value(self, position):
+        return self.data[
+            self.offsets[position]:self.offsets[position + 1] - 1
+        ].decode()
+
+    def _lower_bound(self, key):
+        low, high = 0, len(self.offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._value(middle).casefold() < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, value):
+        key = value.casefold()
+        position = self._lower_bound(key)
+        while position < len(self.offsets) - 1:
+            found = self._value(position)
+            if found.casefold() != key:
+                break
+            if found == value:
+                return position
+            position += 1
+        return None
+
+    def _search_base(self, prefix, limit):
+        position = self._lower_bound(prefix)
+        found = 0
+        while position < len(self.offsets) - 1 and found < limit:
+            value = self._value(position)
+            if not value.casefold().startswith(prefix):
+                break
+            if value not in self.removed:
+                found += 1
+                yield value
+            position += 1
+
+    def _maybe_merge(self):
+        if len(self.added) + len(self.removed) < self.merge_every:
+            return
+        values = [
+            self._value(position)
+            for position in range(len(self.offsets) - 1)
+        ]
+        self._build(sorted(
+            [value for value in values if value not in self.removed]
+            + self.added.values,
+            key=str.casefold
+        ))
+
+
+class Autocomplete:
+    """
+    Индекс значений поля field модели в памяти процесса.
+
+    Строится одним запросом при первом обращении, дальше меняется
+    сигналами. Процессы сверяют счётчик изменений в кэше: если его
+    сдвинул другой процесс, индекс перестраивается. Между процессами
+    это работает только с общим кэшем (SQLiteCache, memcached).
+    """
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self.version_key = f'autocomplete:{model._meta.label_lower}'
+        self.index = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def search(self, prefix, limit):
+        version = cache.get(self.version_key)
+        with self.lock:
+            # Счётчика нет в кэше - неизвестно, что менялось без нас.
+            if version is None or version != self.version:
+                self._rebuild(version)
+            return self.index.search(prefix, limit)
+
+    def changed(self, added=None, removed=None):
+        """Применяет изменение; вызывать после коммита транзакции."""
+        try:
+            version = cache.incr(self.version_key)
+        except ValueError:
+            version = None
+        with self.lock:
+            if self.index is None:
+                return
+            if removed:
+                self.index.discard(removed)
+            if added:
+                self.index.add(added)
+            # Свои изменения уже в индексе; если счётчик ушёл дальше,
+            # были и чужие - тогда перестроим индекс при следующем поиске.
+            consistent = (
+                version is not None and self.version is not None
+                and version == self.version + 1
+            )
+            self.version = version if consistent else None
+
+    def _rebuild(self, version):
+        if version is None:
+            cache.add(self.version_key, 0, timeout=None)
+            version = cache.get(self.version_key)
+        values = self.model._default_manager.order_by().values_list(
+            self.field, flat=True
+        ).iterator()
+        if settings.AUTOCOMPLETE_COMPACT:
+            self.index = CompactPrefixIndex(
+                values, settings.AUTOCOMPLETE_COMPACT_MERGE
+            )
+        else:
+            self.index = PrefixIndex(values)
+        self.version = version
+
+
+users = Autocomplete(User, 'username')
+groups = Autocomplete(Group, 'slug')
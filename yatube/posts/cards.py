@@ -0,0 +1,77 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import timing
+
+CARD_TEMPLATE = 'posts/includes/post.html'
+
+
+def _version_key(kind, pk):
+    return f'post_card:version:{kind}:{pk}'
+
+
+def bump_version(kind, pk):
+    """Инвалидирует карточки, зависящие от поста, автора или группы."""
+    cache.set(_version_key(kind, pk), uuid.uuid4().hex[:8], None)
+
+
+def get_version(kind, pk):
+    """Текущая версия; если её нет в кэше, заводит новую."""
+    key = _version_key(kind, pk)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex[:8]
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(pairs):
+    """Версии для пар (вид, pk) одним запросом к кэшу; нет - заводит."""
+    keys = {pair: _version_key(*pair) for pair in pairs}
+    versions = cache.get_many(keys.values())
+    missing = {
+        key: uuid.uuid4().hex[:8]
+        for key in set(keys.values()) - set(versions)
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {pair: versions[key] for pair, key in keys.items()}
+
+
+def card_keys(posts, variant):
+    """Ключи карточек с учётом версий поста, автора и группы."""
+    version_pairs = {
+        post.pk: (
+            ('post', post.pk),
+            ('user', post.author_id),
+            ('group', post.group_id),
+        )
+        for post in posts
+    }
+    versions = get_versions(
+        {pair for pairs in version_pairs.values() for pair in pairs}
+    )
+    return {
+        pk: 'post_card:{}:{}:{}'.format(
+            pk, variant, '.'.join(versions[pair] for pair in pairs)
+        )
+        for pk, pairs in version_pairs.items()
+    }
+
+
+def get_cards(posts, variant):
+    """Одним запросом к кэшу достаёт готовые карточки страницы."""
+    keys = card_keys(posts, variant)
+    cached = cache.get_many(keys.values())
+    timing.cache_lookup(hits=len(cached), misses=len(keys) - len(cached))
+    return keys, {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+
+
+def set_card(key, html):
+    cache.set(key, html, settings.POST_CARD_CACHE_TIMEOUT)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from core.checks import is_process_local
+
+
+@register(Tags.caches)
+def check_thumbnail_queue(app_configs, **kwargs):
+    # Воркер generate_thumbnails сбрасывает карточки и страницы поста
+    # в своём процессе; веб-процессы узнают об этом только через общий кэш.
+    if not settings.POST_THUMBNAILS_ASYNC or not is_process_local():
+        return []
+    return [Error(
+        'POST_THUMBNAILS_ASYNC требует общего кэша default: с кэшем '
+        'отдельного процесса страницы и карточки постов не увидят '
+        'миниатюры, сделанные воркером.',
+        hint='Используйте core.cache_backends.SQLiteCache или Redis, '
+             'либо POST_THUMBNAILS_ASYNC = False.',
+        id='posts.E001',
+    )]
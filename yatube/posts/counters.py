@@ -0,0 +1,104 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Profile
+from .models import Comment, Follow, Post, User
+
+
+def bump_profile(user_id, **deltas):
+    """
+    Сдвигает счётчики профиля, не опуская их ниже нуля.
+
+    Профиля нет (loaddata, bulk_create) - он создаётся и считается по
+    строкам, где уже учтён этот сдвиг. Уменьшение его не создаёт:
+    пользователя может удалять каскад.
+    """
+    updated = Profile.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        create_profile(user_id)
+
+
+def create_profile(user_id):
+    Profile.objects.get_or_create(user_id=user_id)
+    reconcile(
+        profiles=Profile.objects.filter(user_id=user_id),
+        posts=Post.objects.none()
+    )
+    return Profile.objects.get(user_id=user_id)
+
+
+def ensure_profile(user):
+    """Профиль пользователя; недостающий создаётся с верными счётчиками."""
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        user.profile = create_profile(user.pk)
+        return user.profile
+
+
+def bump_post(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=Greatest(F('comment_count') + delta, 0)
+    )
+
+
+def _count(queryset, field, outer='pk'):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef(outer)}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+def reconcile(profiles=None, posts=None):
+    """
+    Пересчитывает счётчики по фактическим строкам.
+
+    Возвращает число исправленных профилей и постов.
+    """
+    if profiles is None:
+        missing = User.objects.filter(profile__isnull=True)
+        Profile.objects.bulk_create(
+            [Profile(user_id=pk) for pk in missing.values_list(
+                'pk', flat=True
+            )],
+            ignore_conflicts=True
+        )
+        profiles = Profile.objects.all()
+    if posts is None:
+        posts = Post.objects.all()
+    profiles = profiles.annotate(
+        actual_posts=_count(Post.objects.all(), 'author', 'user_id'),
+        actual_followers=_count(Follow.objects.all(), 'author', 'user_id'),
+        actual_following=_count(Follow.objects.all(), 'user', 'user_id'),
+    ).exclude(
+        post_count=F('actual_posts'),
+        follower_count=F('actual_followers'),
+        following_count=F('actual_following'),
+    ).values_list(
+        'pk', 'actual_posts', 'actual_followers', 'actual_following'
+    )
+    fixed_profiles = 0
+    for pk, post_count, follower_count, following_count in list(profiles):
+        Profile.objects.filter(pk=pk).update(
+            post_count=post_count,
+            follower_count=follower_count,
+            following_count=following_count,
+        )
+        fixed_profiles += 1
+    posts = posts.annotate(
+        actual_comments=_count(Comment.objects.all(), 'post')
+    ).exclude(
+        comment_count=F('actual_comments')
+    ).values_list('pk', 'actual_comments')
+    fixed_posts = 0
+    for pk, comment_count in list(posts):
+        Post.objects.filter(pk=pk).update(comment_count=comment_count)
+        fixed_posts += 1
+    return fixed_profiles, fixed_posts
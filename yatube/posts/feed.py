@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import transaction
+
+from .models import FeedItem, Follow, Post
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_create(
+        FeedItem(
+            user_id=user_id,
+            author_id=post.author_id,
+            post_id=post.pk,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту подписчика все посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).order_by().values_list('pk', 'pub_date')
+    _bulk_create(
+        FeedItem(
+            user_id=user_id,
+            author_id=author_id,
+            post_id=post_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def trim_feed(user_id, author_id):
+    """Убирает из ленты подписчика посты автора."""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def _bulk_create(items):
+    batch = []
+    with transaction.atomic():
+        for item in items:
+            batch.append(item)
+            if len(batch) >= settings.FEED_BATCH_SIZE:
+                FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
@@ -1,5 +1,7 @@
 from django import forms
+from django.conf import settings
 from .models import Post, Comment
+from .uploads import too_many_pixels
 
 
 class PostForm(forms.ModelForm):
@@ -7,6 +9,44 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean_image(self):
+        """Отклоняет слишком тяжёлые картинки и картинки-бомбы."""
+        if 'image' in self.upload_errors:
+            raise forms.ValidationError(self.upload_errors['image'])
+        image = self.cleaned_data.get('image')
+        if not image or not hasattr(image, 'image'):
+            return image
+        if image.size > settings.POST_IMAGE_MAX_BYTES:
+            raise forms.ValidationError(
+                'Файл больше '
+                f'{settings.POST_IMAGE_MAX_BYTES // (1024 * 1024)} МБ.'
+            )
+        # Размеры из заголовка: картинку при этом никто не декодирует.
+        if too_many_pixels(*image.image.size):
+            raise forms.ValidationError(
+                'Слишком большое разрешение картинки.'
+            )
+        return image
+
+    def save(self, commit=True):
+        """Запоминает размеры, формат и вес картинки при загрузке."""
+        if 'image' in self.changed_data:
+            image = self.cleaned_data.get('image')
+            if image and hasattr(image, 'image'):
+                self.instance.set_image_metadata(
+                    image.image.width,
+                    image.image.height,
+                    image.image.format,
+                    image.size
+                )
+            else:
+                self.instance.set_image_metadata()
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,43 @@
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class KVStore(CachedDBKVStore):
+    """
+    KV-хранилище sorl с пакетным чтением: get_many кэша и один запрос.
+
+    Промахи не кэшируются: строку миниатюры пишет воркер в другом
+    процессе, и закэшированное "нет" скрывало бы её от этого процесса.
+    """
+
+    def _get_raw(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            value = KVStoreModel.objects.filter(key=key).values_list(
+                'value', flat=True
+            ).first()
+            if value is not None:
+                self.cache.set(
+                    key, value, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+                )
+        return value
+
+    def get_many(self, image_files):
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value'))
+            self.cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(found)
+        return [
+            deserialize_image_file(values[key]) if key in values else None
+            for key in keys
+        ]
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts.models import Post
+
+FIELDS = ['image_width', 'image_height', 'image_format', 'image_size']
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры, формат и вес картинок уже созданных постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов сохранять одним запросом.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        posts = Post.objects.exclude(image='').filter(
+            image_width__isnull=True
+        ).order_by('pk').only('pk', 'image')
+        last_pk, done, missing = 0, 0, 0
+        while True:
+            # Идём пачками по pk, чтобы не держать курсор открытым
+            # во время записи.
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            read = []
+            for post in batch:
+                if self.read_metadata(post):
+                    read.append(post)
+                else:
+                    missing += 1
+            Post.objects.bulk_update(read, FIELDS)
+            done += len(read)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено постов: {done}, не удалось прочитать: {missing}'
+        ))
+
+    def read_metadata(self, post):
+        try:
+            with post.image.open('rb') as image_file:
+                # Image.open читает только заголовок, без декодирования.
+                with Image.open(image_file) as image:
+                    post.set_image_metadata(
+                        image.width,
+                        image.height,
+                        image.format,
+                        post.image.size
+                    )
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return False
+        return True
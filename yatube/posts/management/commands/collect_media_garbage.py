@@ -0,0 +1,208 @@
+import hashlib
+import math
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.models import Post
+from posts.storage import image_storage
+
+
+class BloomFilter:
+    """
+    Множество строк в фиксированной памяти.
+
+    Может ошибочно ответить «есть» (с вероятностью error_rate), но не
+    наоборот: для сборщика это значит лишний сохранённый файл, а не
+    удалённый нужный.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(
+            int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8
+        )
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode()).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little')
+        return (
+            (first + index * second) % self.size
+            for index in range(self.hashes)
+        )
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & 1 << (position & 7)
+            for position in self._positions(value)
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов и миниатюры, на которые не ссылается '
+        'ни один пост, и их записи в KV-хранилище sorl.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов проверять и удалять за раз.'
+        )
+        parser.add_argument(
+            '--rate', type=float, default=100,
+            help='Не больше стольких удалений в секунду, 0 - без ограничения.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд: их пост может '
+                 'быть ещё не сохранён.'
+        )
+        parser.add_argument(
+            '--bloom', action='store_true',
+            help='Держать имена в фильтре Блума, а не в множестве.'
+        )
+
+    def handle(self, *args, dry_run, batch_size, rate, min_age, bloom,
+               **options):
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.rate = rate
+        self.verbosity = options['verbosity']
+        posts = Post.objects.exclude(image='').order_by()
+        referenced = BloomFilter(posts.count()) if bloom else set()
+        for name in posts.values_list('image', flat=True).iterator(
+            chunk_size=batch_size
+        ):
+            referenced.add(name)
+        sources = self.collect_kvstore(referenced)
+        thumbnails = self.thumbnail_names(bloom)
+        originals = self.collect_files(
+            image_storage, Post.image.field.upload_to, referenced, min_age,
+            image_storage.purge, recheck=True
+        )
+        thumbnail_files = self.collect_files(
+            default.storage, sorl_settings.THUMBNAIL_PREFIX, thumbnails,
+            min_age, default.storage.delete
+        )
+        verb = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: картинок {originals}, миниатюр {thumbnail_files}, '
+            f'записей sorl {sources}'
+        ))
+
+    def collect_kvstore(self, referenced):
+        """Записи sorl об исходниках без постов вместе с их миниатюрами."""
+        def orphans():
+            for _, value in self.kvstore_images():
+                image_file = deserialize_image_file(value)
+                if not self.is_thumbnail(image_file.name) and (
+                    image_file.name not in referenced
+                ):
+                    yield image_file.name, image_file
+        return self.delete_in_batches(
+            orphans(), default.kvstore.delete, recheck=True
+        )
+
+    def thumbnail_names(self, bloom):
+        """Имена миниатюр, которые ещё есть в KV-хранилище."""
+        thumbnails = BloomFilter(
+            KVStoreModel.objects.filter(
+                key__startswith=add_prefix('', 'image')
+            ).count()
+        ) if bloom else set()
+        for _, value in self.kvstore_images():
+            name = deserialize_image_file(value).name
+            if self.is_thumbnail(name):
+                thumbnails.add(name)
+        return thumbnails
+
+    def kvstore_images(self):
+        # Постранично по ключу, а не одним курсором: во время обхода
+        # записи удаляются.
+        prefix = add_prefix('', 'image')
+        entries = KVStoreModel.objects.filter(
+            key__startswith=prefix
+        ).order_by('key').values_list('key', 'value')
+        last_key = prefix
+        while True:
+            batch = list(entries.filter(key__gt=last_key)[:self.batch_size])
+            if not batch:
+                return
+            last_key = batch[-1][0]
+            yield from batch
+
+    def is_thumbnail(self, name):
+        return name.startswith(sorl_settings.THUMBNAIL_PREFIX)
+
+    def collect_files(self, storage, directory, referenced, min_age,
+                      delete, recheck=False):
+        """Файлы каталога хранилища, которых нет в referenced."""
+        def orphans():
+            root = storage.path(directory)
+            oldest = time.time() - min_age
+            for path, _, files in os.walk(root):
+                for file_name in files:
+                    # Точкой начинаются недописанные временные файлы.
+                    if file_name.startswith('.'):
+                        continue
+                    full_path = os.path.join(path, file_name)
+                    name = os.path.relpath(
+                        full_path, storage.path('')
+                    ).replace(os.sep, '/')
+                    if name in referenced:
+                        continue
+                    try:
+                        if os.path.getmtime(full_path) > oldest:
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    yield name, name
+        return self.delete_in_batches(orphans(), delete, recheck)
+
+    def delete_in_batches(self, orphans, delete, recheck):
+        deleted, batch = 0, []
+        for orphan in orphans:
+            batch.append(orphan)
+            if len(batch) >= self.batch_size:
+                deleted += self.delete_batch(batch, delete, recheck)
+                batch = []
+        if batch:
+            deleted += self.delete_batch(batch, delete, recheck)
+        return deleted
+
+    def delete_batch(self, batch, delete, recheck):
+        if recheck:
+            # Пост с картинкой мог появиться уже после прохода по базе.
+            used = set(Post.objects.filter(
+                image__in=[name for name, _ in batch]
+            ).values_list('image', flat=True))
+            batch = [item for item in batch if item[0] not in used]
+        started = time.monotonic()
+        for name, item in batch:
+            if self.verbosity > 1:
+                self.stdout.write(name)
+            if not self.dry_run:
+                delete(item)
+        if self.rate and not self.dry_run:
+            time.sleep(max(
+                len(batch) / self.rate - (time.monotonic() - started), 0
+            ))
+        return len(batch)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.threads import fill_paths
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет пути в ветке у комментариев, созданных в обход save() '
+        '(bulk_create, loaddata).'
+    )
+
+    def handle(self, *args, **options):
+        filled = fill_paths()
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено путей: {filled}'
+        ))
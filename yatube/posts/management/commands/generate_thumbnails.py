@@ -0,0 +1,55 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+
+
+def work(once, poll):
+    while True:
+        task = thumbnails.claim()
+        if task is None:
+            if once:
+                return
+            time.sleep(poll)
+            continue
+        thumbnails.process(task)
+
+
+class Command(BaseCommand):
+    help = 'Генерирует миниатюры картинок постов из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=2,
+            help='Число процессов-воркеров.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Завершиться, когда очередь опустеет.'
+        )
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help='Пауза между опросами пустой очереди, секунд.'
+        )
+
+    def handle(self, *args, processes, once, poll, **options):
+        requeued = thumbnails.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь задач: {requeued}')
+        if processes <= 1:
+            work(once, poll)
+            return
+        # Дочерние процессы не должны делить соединение с родителем.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=work, args=(once, poll))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики профилей и постов.'
+
+    def handle(self, *args, **options):
+        fixed_profiles, fixed_posts = reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено профилей: {fixed_profiles}, постов: {fixed_posts}'
+        ))
@@ -0,0 +1,70 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from posts import tags
+from posts.models import Post, StoredImage, ThumbnailTask
+from posts.storage import image_storage, is_content_addressed
+
+
+class Command(BaseCommand):
+    help = 'Переносит картинки постов в хранилище по хэшу содержимого.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько имён файлов выбирать одним запросом.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        names = Post.objects.exclude(image='').order_by(
+            'image'
+        ).values_list('image', flat=True).distinct()
+        last_name, moved, missing = '', 0, 0
+        while True:
+            batch = list(names.filter(image__gt=last_name)[:batch_size])
+            if not batch:
+                break
+            last_name = batch[-1]
+            for name in batch:
+                if is_content_addressed(name):
+                    continue
+                if self.rehome(name):
+                    moved += 1
+                else:
+                    missing += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {moved}, не найдено: {missing}'
+        ))
+
+    def rehome(self, name):
+        try:
+            with image_storage.open(name, 'rb') as image_file:
+                new_name = image_storage.save(name, image_file)
+        except (OSError, SuspiciousFileOperation):
+            return False
+        with transaction.atomic():
+            posts = list(
+                Post.objects.filter(image=name).select_related(
+                    'author', 'group'
+                )
+            )
+            Post.objects.filter(image=name).update(
+                image=new_name, updated_at=timezone.now()
+            )
+            ThumbnailTask.objects.filter(image=name).update(image=new_name)
+            if posts:
+                # save() добавил одну ссылку, а постов с файлом может быть
+                # несколько.
+                StoredImage.objects.filter(name=new_name).update(
+                    references=F('references') + len(posts) - 1
+                )
+            else:
+                # Посты успели сменить картинку: убираем ссылку save().
+                image_storage.delete(new_name)
+        image_storage.delete(name)
+        for post in posts:
+            tags.invalidate_post(post)
+        return True
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_feeditem'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='feeditem',
+            options={'ordering': ['-pub_date', '-post_id'], 'verbose_name': 'Запись ленты', 'verbose_name_plural': 'Записи ленты'},
+        ),
+    ]
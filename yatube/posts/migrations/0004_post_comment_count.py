@@ -0,0 +1,50 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Profile = apps.get_model('users', 'Profile')
+    Post = apps.get_model('posts', 'Post')
+    users = User.objects.annotate(
+        posts_total=Count('posts', distinct=True),
+        followers_total=Count('following', distinct=True),
+        following_total=Count('follower', distinct=True),
+    ).values_list('pk', 'posts_total', 'followers_total', 'following_total')
+    Profile.objects.bulk_create(
+        [
+            Profile(
+                user_id=pk,
+                post_count=post_count,
+                follower_count=follower_count,
+                following_count=following_count,
+            )
+            for pk, post_count, follower_count, following_count in users
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    for pk, total in Post.objects.order_by().annotate(
+        comments_total=Count('comments')
+    ).filter(comments_total__gt=0).values_list('pk', 'comments_total'):
+        Post.objects.filter(pk=pk).update(comment_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_feeditem_ordering'),
+        ('users', '0001_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.CharField(max_length=255, verbose_name='Картинка')),
+                ('geometry', models.CharField(max_length=50, verbose_name='Размер')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnail_tasks', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Задача миниатюры',
+                'verbose_name_plural': 'Задачи миниатюр',
+                'ordering': ['pk'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='thumbnailtask',
+            index=models.Index(fields=['status', 'id'], name='thumbnail_task_status_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from posts import search
+    search.install(schema_editor.connection, rebuild=True)
+
+
+def drop_index(apps, schema_editor):
+    from posts import search
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_stored_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
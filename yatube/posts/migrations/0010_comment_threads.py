@@ -0,0 +1,53 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:34
+
+from django.db import migrations, models
+from django.utils.http import int_to_base36
+import django.db.models.deletion
+
+PATH_STEP = 8
+BATCH_SIZE = 500
+
+
+def fill_paths(apps, schema_editor):
+    # Все старые комментарии - корни своих веток.
+    Comment = apps.get_model('posts', 'Comment')
+    last_pk = 0
+    while True:
+        batch = list(
+            Comment.objects.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        for comment in batch:
+            comment.path = int_to_base36(comment.pk).rjust(PATH_STEP, '0')
+        Comment.objects.bulk_update(batch, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на комментарий'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=240, verbose_name='Путь в ветке'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', 'pub_date'], name='comment_post_root_idx'),
+        ),
+    ]
@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.utils.http import int_to_base36
 from core.models import CreatedModel
 
+from .storage import image_storage
+
 User = get_user_model()
 
 
@@ -49,19 +52,80 @@ class Post(CreatedModel):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        null=True,
+        editable=False
+    )
+    image_format = models.CharField(
+        verbose_name='Формат картинки',
+        max_length=10,
+        blank=True,
+        editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        verbose_name='Размер картинки в байтах',
+        null=True,
+        editable=False
+    )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ["-pub_date"]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def set_image_metadata(self, width=None, height=None, image_format='',
+                           size=None):
+        self.image_width = width
+        self.image_height = height
+        self.image_format = image_format or ''
+        self.image_size = size
+
 
 class Comment(CreatedModel):
+    """
+    Комментарий; ответы образуют ветки.
+
+    path - пути предков и свой id в base36 фиксированной ширины:
+    сортировка по path даёт ветку в порядке обхода, поддерево - это
+    диапазон path. Путь заполняется в save() после вставки, поэтому
+    bulk_create его не заполняет. Ответы глубже MAX_DEPTH встают
+    в ветку рядом с родителем. Пустые пути заполняет
+    threads.fill_paths (команда fill_comment_paths и миграции).
+    """
+    PATH_STEP = 8
+    MAX_DEPTH = 30
+
     post = models.ForeignKey(
         Post,
         verbose_name='Пост комментария',
@@ -78,14 +142,64 @@ class Comment(CreatedModel):
         verbose_name='Текст комментария',
         help_text='Текст вашего комментария'
     )
+    parent = models.ForeignKey(
+        'self',
+        verbose_name='Ответ на комментарий',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True,
+        null=True
+    )
+    path = models.CharField(
+        verbose_name='Путь в ветке',
+        max_length=PATH_STEP * MAX_DEPTH,
+        default='',
+        editable=False
+    )
 
     class Meta:
+        ordering = ['pub_date']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'],
+                name='comment_post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['post', 'path'],
+                name='comment_post_path_idx'
+            ),
+            models.Index(
+                fields=['post', 'parent', 'pub_date'],
+                name='comment_post_root_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def depth(self):
+        return max(len(self.path) // self.PATH_STEP - 1, 0)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not self.path:
+                self.path = self.build_path()
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    def build_path(self):
+        return self.parent_path() + int_to_base36(self.pk).rjust(
+            self.PATH_STEP, '0'
+        )
+
+    def parent_path(self):
+        if self.parent_id is None:
+            return ''
+        return self.parent.path[:self.PATH_STEP * (self.MAX_DEPTH - 1)]
+
 
 class Event(models.Model):
     name = models.CharField(max_length=200)
@@ -116,3 +230,135 @@ class Follow(CreatedModel):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+
+
+class FeedItem(models.Model):
+    """Материализованная лента подписок: одна запись на пост и подписчика."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Подписчик',
+        on_delete=models.CASCADE,
+        related_name='feed'
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата создания поста',
+    )
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_item'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+
+class StoredImage(models.Model):
+    """Файл в хранилище картинок по хэшу и число ссылок на него."""
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=255,
+        unique=True
+    )
+    references = models.PositiveIntegerField(
+        verbose_name='Ссылок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class ThumbnailTask(models.Model):
+    """
+    Очередь фоновой обработки картинок постов.
+
+    geometry - размер миниатюры или ORIGINAL, если задача - перекодировать
+    сам оригинал.
+    """
+    ORIGINAL = 'original'
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='thumbnail_tasks'
+    )
+    image = models.CharField(
+        verbose_name='Картинка',
+        max_length=255
+    )
+    geometry = models.CharField(
+        verbose_name='Размер',
+        max_length=50
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Обновлено',
+        auto_now=True
+    )
+
+    class Meta:
+        ordering = ['pk']
+        verbose_name = 'Задача миниатюры'
+        verbose_name_plural = 'Задачи миниатюр'
+        indexes = [
+            models.Index(
+                fields=['status', 'id'],
+                name='thumbnail_task_status_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.image} {self.geometry}'
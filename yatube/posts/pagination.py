@@ -0,0 +1,144 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class CursorPage:
+    """Страница keyset-пагинации: без COUNT(*) и OFFSET."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset-пагинация по паре (дата, id) в порядке убывания.
+
+    Курсор - это значения ключей крайней записи страницы, поэтому
+    глубокие страницы стоят столько же, сколько первая.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 id_field='pk'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.date_field = date_field
+        self.id_field = id_field
+
+    def get_page(self, after=None, before=None):
+        after = self.decode(after)
+        before = self.decode(before) if after is None else None
+        if before is not None:
+            return self._page_before(before)
+        return self._page_after(after)
+
+    def get_page_since(self, since=None):
+        """
+        Записи новее курсора по возрастанию даты - для опроса.
+
+        Без курсора - с самой ранней записи; next_cursor есть, если
+        за одну страницу новые записи не уместились.
+        """
+        cursor = self.decode(since)
+        queryset = self.object_list.order_by(self.date_field, self.id_field)
+        if cursor is not None:
+            queryset = queryset.filter(self._condition('gt', cursor))
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows, self, self.encode(rows[-1]) if has_next else None, None
+        )
+
+    def _page_after(self, cursor):
+        queryset = self.object_list.order_by(
+            f'-{self.date_field}', f'-{self.id_field}'
+        )
+        if cursor is not None:
+            queryset = queryset.filter(self._condition('lt', cursor))
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows,
+            self,
+            self.encode(rows[-1]) if has_next else None,
+            self.encode(rows[0]) if cursor is not None and rows else None,
+        )
+
+    def _page_before(self, cursor):
+        queryset = self.object_list.order_by(
+            self.date_field, self.id_field
+        ).filter(self._condition('gt', cursor))
+        rows = list(queryset[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            rows,
+            self,
+            self.encode(rows[-1]) if rows else None,
+            self.encode(rows[0]) if has_previous else None,
+        )
+
+    def _condition(self, lookup, cursor):
+        date, pk = cursor
+        return (
+            Q(**{f'{self.date_field}__{lookup}': date})
+            | Q(**{
+                self.date_field: date,
+                f'{self.id_field}__{lookup}': pk,
+            })
+        )
+
+    def encode(self, obj):
+        # Страницы из .values() состоят из словарей.
+        if isinstance(obj, dict):
+            date, pk = obj[self.date_field], obj[self.id_field]
+        else:
+            date = getattr(obj, self.date_field)
+            pk = getattr(obj, self.id_field)
+        token = f'{date.isoformat()}|{pk}'.encode()
+        return base64.urlsafe_b64encode(token).decode().rstrip('=')
+
+    @staticmethod
+    def decode(token):
+        """Разбирает курсор; испорченный курсор ведёт на первую страницу."""
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            date, pk = raw.decode().split('|')
+            date = parse_datetime(date)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if date is None:
+            return None
+        return date, pk
@@ -0,0 +1,236 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, ImageOps, features
+
+from core import timing
+
+from .storage import image_storage
+
+SALT = 'posts.resize'
+QUALITY = 85
+CULL_STAMP = '.culled'
+# форматы, в которые можно перекодировать копию: ключ URL -> Pillow
+FORMATS = {'webp': 'WEBP'}
+EXIF_ORIENTATION = 0x0112
+# ориентации EXIF, в которых ширина и высота меняются местами
+ROTATED = (5, 6, 7, 8)
+
+
+def sign(path, width, height, image_format=''):
+    """Подпись пути, размера и формата: без неё endpoint не ресайзит."""
+    value = f'{width}x{height}/{path}'
+    if image_format:
+        value = f'{image_format}:{value}'
+    return salted_hmac(SALT, value).hexdigest()[:16]
+
+
+def check_signature(signature, path, width, height, image_format=''):
+    return constant_time_compare(
+        signature, sign(path, width, height, image_format)
+    )
+
+
+def format_available(image_format):
+    """Поддерживает ли сборка Pillow запись в формат image_format."""
+    return not image_format or (
+        image_format in FORMATS and features.check(image_format)
+    )
+
+
+def resize_url(image, width, height, image_format=''):
+    """
+    Подписанная ссылка на картинку, уменьшенную до width x height.
+
+    image_format - ключ FORMATS, если копия нужна не в формате
+    оригинала.
+    """
+    kwargs = {
+        'signature': sign(image.name, width, height, image_format),
+        'width': width,
+        'height': height,
+        'path': image.name,
+    }
+    if image_format:
+        kwargs['image_format'] = image_format
+    return reverse('posts:resize_image', kwargs=kwargs)
+
+
+def cache_path(path, width, height, image_format=''):
+    """
+    Путь к файлу в дисковом кэше.
+
+    Каталоги шардированы по первым байтам хэша, чтобы в одном каталоге
+    не копились тысячи файлов.
+    """
+    key = f'{width}x{height}/{path}'
+    if image_format:
+        key = f'{image_format}:{key}'
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    extension = (
+        '.' + image_format if image_format
+        else os.path.splitext(path)[1].lower()
+    )
+    return os.path.join(
+        settings.RESIZE_CACHE_ROOT, digest[:2], digest[2:4],
+        digest + extension
+    )
+
+
+def get_resized(path, width, height, image_format=''):
+    """Путь к уменьшенной копии; при первом запросе создаёт её."""
+    target = cache_path(path, width, height, image_format)
+    try:
+        modified = os.path.getmtime(target)
+    except FileNotFoundError:
+        with timing.measure('thumbnail'):
+            resize(path, [(width, height, image_format)])
+            cull(keep=target)
+        return target
+    # mtime служит временем последнего чтения для вытеснения; обновляем
+    # его не на каждый запрос, чтобы чтение не превращалось в запись.
+    if time.time() - modified > settings.RESIZE_CACHE_CULL_INTERVAL:
+        os.utime(target)
+    return target
+
+
+def resize(path, variants):
+    """
+    Делает копии картинки path для всех variants за одно декодирование.
+
+    variants - список (ширина, высота, формат); копия обрезается
+    по центру и пишется в cache_path.
+    """
+    sizes = [(width, height) for width, height, _ in variants]
+    with decoded(path, sizes) as image:
+        resize_image(image, path, variants)
+
+
+@contextmanager
+def decoded(path, sizes):
+    """
+    Открывает картинку path для копий размеров sizes.
+
+    JPEG сразу декодируется в масштабе самой большой копии. Размеры
+    копий даны для картинки, повёрнутой по EXIF, а draft работает
+    с хранимой ориентацией, поэтому для поворотов на 90° они меняются
+    местами.
+    """
+    width = max(width for width, _ in sizes)
+    height = max(height for _, height in sizes)
+    with image_storage.open(path, 'rb') as source:
+        with Image.open(source) as image:
+            if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+                width, height = height, width
+            image.draft('RGB', (width, height))
+            yield image
+
+
+def resize_image(image, path, variants):
+    """Копии variants картинки path из уже открытой image."""
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    for width, height, image_format in variants:
+        _save(
+            ImageOps.fit(image, (width, height), Image.LANCZOS),
+            cache_path(path, width, height, image_format),
+            FORMATS.get(image_format, source_format)
+        )
+
+
+def _save(image, target, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    # Пишем во временный файл и атомарно переименовываем: параллельный
+    # запрос не увидит недописанную картинку.
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            image.save(temp_file, format=image_format, quality=QUALITY)
+        os.replace(temp, target)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def cull(keep=None):
+    """
+    Держит кэш в пределах RESIZE_CACHE_MAX_SIZE байт, удаляя файлы,
+    которые дольше всех не читали. Файл keep не удаляется.
+
+    Обход каталога дорогой, поэтому выполняется не чаще раза
+    в RESIZE_CACHE_CULL_INTERVAL секунд на все процессы.
+    """
+    root = settings.RESIZE_CACHE_ROOT
+    if not _cull_due(root):
+        return
+    files = sorted(_cached_files(root))
+    total = sum(size for _, size, _ in files)
+    for _, size, file_path in files:
+        if total <= settings.RESIZE_CACHE_MAX_SIZE:
+            break
+        if file_path == keep:
+            continue
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _cull_due(root):
+    stamp = os.path.join(root, CULL_STAMP)
+    try:
+        culled = os.path.getmtime(stamp)
+    except FileNotFoundError:
+        culled = 0
+    if time.time() - culled < settings.RESIZE_CACHE_CULL_INTERVAL:
+        return False
+    with open(stamp, 'a'):
+        os.utime(stamp)
+    return True
+
+
+def _cached_files(root):
+    """(mtime, размер, путь) файлов кэша, кроме служебных."""
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.startswith('.'):
+                continue
+            file_path = os.path.join(directory, name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, file_path
+
+
+def serve(target):
+    """
+    Отдаёт файл из кэша без копирования через Python.
+
+    С RESIZE_ACCEL_REDIRECT файл отдаёт nginx, иначе FileResponse
+    использует wsgi.file_wrapper сервера (sendfile).
+    """
+    content_type = mimetypes.guess_type(target)[0]
+    if settings.RESIZE_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = (
+            settings.RESIZE_ACCEL_REDIRECT
+            + os.path.relpath(target, settings.RESIZE_CACHE_ROOT)
+        )
+    else:
+        response = FileResponse(open(target, 'rb'), content_type=content_type)
+    # Путь к картинке не переиспользуется, поэтому копия неизменна.
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
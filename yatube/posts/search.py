@@ -0,0 +1,164 @@
+import base64
+import binascii
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .pagination import CursorPage
+
+TABLE = 'posts_post_fts'
+# Внешний контент: в индексе только токены, текст берётся из posts_post.
+CREATE_TABLE = f'''
+CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+    text, content='posts_post', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+'''
+# Триггеры, а не сигналы: индекс видит и bulk_create, и update().
+CREATE_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO {TABLE} (rowid, text) VALUES (new.id, new.text);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON posts_post
+    BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE} (rowid, text) VALUES (new.id, new.text);
+    END
+    ''',
+]
+DROP = [
+    f'DROP TRIGGER IF EXISTS {TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {TABLE}_update',
+    f'DROP TABLE IF EXISTS {TABLE}',
+]
+MATCH_IDS = f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s'
+# Маркеры подсветки - управляющие символы: их нет в тексте, поэтому
+# сниппет можно экранировать целиком и только потом вставить <mark>.
+RESULTS = f'''
+SELECT rowid, rank,
+       snippet({TABLE}, 0, char(2), char(3), '…', %s)
+FROM {TABLE} WHERE {TABLE} MATCH %s
+'''
+SNIPPET_TOKENS = 16
+
+
+def install(using=connection, rebuild=False):
+    """Создаёт индекс и триггеры; rebuild заполняет индекс заново."""
+    if using.vendor != 'sqlite':
+        return
+    with using.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        for sql in CREATE_TRIGGERS:
+            cursor.execute(sql)
+        if rebuild:
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(using=connection):
+    if using.vendor != 'sqlite':
+        return
+    with using.cursor() as cursor:
+        for sql in DROP:
+            cursor.execute(sql)
+
+
+def installed(using=connection):
+    return TABLE in using.introspection.table_names()
+
+
+def match_expression(query):
+    """
+    Запрос пользователя в синтаксисе FTS5.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 в запросе не
+    работают и не ломают его; последнее слово ищется как префикс.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+    )
+
+
+class SearchPaginator:
+    """
+    Keyset-пагинация результатов поиска по паре (ранг bm25, id).
+
+    Посты страницы получают атрибут snippet - фрагмент текста
+    с подсвеченными словами запроса.
+    """
+
+    def __init__(self, query, per_page):
+        self.match = match_expression(query)
+        self.per_page = int(per_page)
+
+    def get_page(self, after=None):
+        if not self.match:
+            return CursorPage([], self, None, None)
+        cursor = self.decode(after)
+        sql, params = RESULTS, [SNIPPET_TOKENS, self.match]
+        if cursor is not None:
+            sql = f'SELECT * FROM ({sql}) WHERE (rank, rowid) > (%s, %s)'
+            params += list(cursor)
+        sql += ' ORDER BY rank, rowid LIMIT %s'
+        params.append(self.per_page + 1)
+        with connection.cursor() as db:
+            db.execute(sql, params)
+            rows = db.fetchall()
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [pk for pk, _, _ in rows]
+        )
+        object_list = []
+        for pk, _, snippet in rows:
+            if pk in posts:
+                posts[pk].snippet = highlight(snippet)
+                object_list.append(posts[pk])
+        return CursorPage(
+            object_list,
+            self,
+            self.encode(*rows[-1][:2]) if has_next else None,
+            None,
+        )
+
+    @staticmethod
+    def encode(pk, rank):
+        token = f'{rank!r}|{pk}'.encode()
+        return base64.urlsafe_b64encode(token).decode().rstrip('=')
+
+    @staticmethod
+    def decode(token):
+        """Разбирает курсор; испорченный курсор ведёт на первую страницу."""
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            rank, pk = raw.decode().split('|')
+            return float(rank), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
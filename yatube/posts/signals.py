@@ -0,0 +1,190 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, transaction
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_save
+)
+from django.dispatch import receiver
+
+from core.cache import invalidate_tags
+from . import autocomplete, cards, counters, feed, search, tags, threads
+from .models import Comment, Follow, Group, Post, User
+from .storage import image_storage
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_group_slug, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group__slug', 'image'
+            ).first() or (None, None)
+        )
+        # Загрузку сохраняет поле уже после сигнала; она добавит ссылку,
+        # даже если содержимое совпадёт со старой картинкой.
+        instance._image_uploaded = bool(
+            instance.image
+        ) and not instance.image._committed
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.bump_profile(instance.author_id, post_count=1)
+        feed.fan_out_post(instance)
+    previous_image = instance.__dict__.pop('_previous_image', None)
+    uploaded = instance.__dict__.pop('_image_uploaded', False)
+    if previous_image and (
+        uploaded or previous_image != instance.image.name
+    ):
+        image_storage.release(previous_image)
+    tags.invalidate_post(
+        instance, getattr(instance, '_previous_group_slug', None)
+    )
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Вход пользователя сохраняет только last_login - лишний запрос ни к чему.
+    if instance.pk and not raw and (
+        update_fields is None or 'username' in update_fields
+    ):
+        instance._previous_username = User.objects.filter(
+            pk=instance.pk
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields != frozenset({'last_login'}):
+        cards.bump_version('user', instance.pk)
+        invalidate_tags(*tags.author_tags(instance))
+    _index_changed(
+        autocomplete.users, instance.username,
+        instance.__dict__.pop('_previous_username', None), created
+    )
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: autocomplete.users.changed(removed=instance.username)
+    )
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        cards.bump_version('group', instance.pk)
+        _group_changed(instance)
+    _index_changed(
+        autocomplete.groups, instance.slug,
+        instance.__dict__.pop('_previous_slug', None), created
+    )
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    _group_changed(instance)
+    transaction.on_commit(
+        lambda: autocomplete.groups.changed(removed=instance.slug)
+    )
+
+
+def _index_changed(index, name, previous, created=False):
+    """Обновляет индекс автодополнения после коммита, если имя изменилось."""
+    if created:
+        previous = None
+    elif previous is None or previous == name:
+        return
+    transaction.on_commit(lambda: index.changed(added=name, removed=previous))
+
+
+def _group_changed(group):
+    usernames = User.objects.filter(
+        posts__group=group
+    ).order_by().values_list('username', flat=True).distinct()
+    invalidate_tags(
+        'index',
+        f'group:{group.slug}',
+        *(f'profile:{username}' for username in usernames),
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_profile(instance.author_id, post_count=-1)
+    cards.bump_version('comments', instance.pk)
+    if instance.image:
+        image_storage.release(instance.image.name)
+    invalidate_tags(*tags.post_tags(instance, [
+        instance.group.slug if instance.group_id else None,
+    ]))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_profile(instance.user_id, following_count=1)
+        counters.bump_profile(instance.author_id, follower_count=1)
+        feed.backfill_feed(instance.user_id, instance.author_id)
+        _follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_profile(instance.user_id, following_count=-1)
+    counters.bump_profile(instance.author_id, follower_count=-1)
+    feed.trim_feed(instance.user_id, instance.author_id)
+    _follow_changed(instance)
+
+
+def _follow_changed(follow):
+    invalidate_tags(
+        f'follow:{follow.user_id}',
+        f'profile:{follow.user.username}',
+        f'profile:{follow.author.username}',
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_post(instance.post_id, 1)
+    cards.bump_version('comments', instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+    cards.bump_version('comments', instance.post_id)
+
+
+@receiver(post_migrate)
+def migrated(sender, using='default', apps=None, **kwargs):
+    # Миграции SQLite пересоздают таблицу posts_post и теряют триггеры
+    # поискового индекса; возвращаем их после каждой миграции.
+    if sender.name != 'posts':
+        return
+    if search.installed(connections[using]):
+        search.install(connections[using])
+    # Комментарии из данных миграций и старых версий - без путей в ветке.
+    if apps is None or _has_field(apps, 'Comment', 'path'):
+        threads.fill_paths(using)
+
+
+def _has_field(apps, model, field):
+    try:
+        apps.get_model('posts', model)._meta.get_field(field)
+    except (LookupError, FieldDoesNotExist):
+        return False
+    return True
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+CONTENT_NAME = re.compile(
+    r'(?:.+/)?(?P<shard>[0-9a-f]{2}/[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})'
+    r'\.[a-z0-9]+$'
+)
+
+
+def is_content_addressed(name):
+    match = CONTENT_NAME.fullmatch(name or '')
+    return bool(match) and match['digest'].startswith(
+        match['shard'].replace('/', '')
+    )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, где имя файла - sha256 содержимого.
+
+    Файл из upload_to 'posts/' ложится в posts/ab/cd/<sha256>.jpg:
+    вложенные каталоги не дают одному каталогу разрастись, одинаковые
+    картинки хранятся один раз. Каждое сохранение добавляет ссылку
+    в StoredImage, delete() её убирает; файл удаляется вместе
+    с последней ссылкой. Файлы со старыми именами удаляются как обычно.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Настоящее имя выбирает _save по содержимому.
+        return name
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        with transaction.atomic():
+            stored, _ = self._model().objects.get_or_create(name=name)
+            self._model().objects.filter(pk=stored.pk).update(
+                references=F('references') + 1
+            )
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def content_name(self, name, content):
+        """Имя по хэшу содержимого в каталоге и с расширением name."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, basename = posixpath.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        )
+
+    def _write(self, name, content):
+        # Одно и то же содержимое могут писать параллельно: пишем
+        # во временный файл и атомарно подменяем, результат одинаков.
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp, self.file_permissions_mode)
+            os.replace(temp, full_path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    def delete(self, name):
+        if not is_content_addressed(name):
+            return super().delete(name)
+        stored = self._model().objects.filter(name=name)
+        with transaction.atomic():
+            if stored.filter(references__gt=1).update(
+                references=F('references') - 1
+            ):
+                return
+            stored.delete()
+        transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def release(self, name):
+        """Убирает ссылку на файл, если он из этого хранилища."""
+        if is_content_addressed(name):
+            self.delete(name)
+
+    def purge(self, name):
+        """Удаляет файл вместе со всеми ссылками на него."""
+        self._model().objects.filter(name=name).delete()
+        super().delete(name)
+
+    def _delete_unreferenced(self, name):
+        # Пока коммитились, то же содержимое могли загрузить снова.
+        if not self._model().objects.filter(name=name).exists():
+            super().delete(name)
+
+    def _model(self):
+        return apps.get_model('posts', 'StoredImage')
+
+
+image_storage = ContentAddressedStorage()
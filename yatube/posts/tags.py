@@ -0,0 +1,41 @@
+from core.cache import invalidate_tags
+from . import cards
+from .models import Follow, Post
+
+
+def follow_tags(author_id):
+    return [
+        f'follow:{user_id}' for user_id in Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True).iterator()
+    ]
+
+
+def post_tags(post, group_slugs):
+    return [
+        'index',
+        f'profile:{post.author.username}',
+        *(f'group:{slug}' for slug in group_slugs if slug),
+        *follow_tags(post.author_id),
+    ]
+
+
+def author_tags(user):
+    group_slugs = Post.objects.filter(
+        author=user, group__isnull=False
+    ).order_by().values_list('group__slug', flat=True).distinct()
+    return [
+        'index',
+        f'profile:{user.username}',
+        *(f'group:{slug}' for slug in group_slugs),
+        *follow_tags(user.pk),
+    ]
+
+
+def invalidate_post(post, previous_group_slug=None):
+    """Сбрасывает карточку поста и все страницы, где он показан."""
+    cards.bump_version('post', post.pk)
+    invalidate_tags(*post_tags(post, [
+        post.group.slug if post.group_id else None,
+        previous_group_slug,
+    ]))
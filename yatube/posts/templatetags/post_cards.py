@@ -0,0 +1,37 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from .. import cards, thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """
+    Выводит карточку поста из кэша.
+
+    При первом вызове на странице карточки всех постов page_obj
+    достаются из кэша одним get_many; промахи рендерятся шаблоном,
+    а их миниатюры заранее ищутся одним пакетным чтением.
+    """
+    request = context.get('request')
+    variant = 'profile' if request and 'profile' in request.path else 'full'
+    state = context.render_context.get('post_cards')
+    if state is None or post.pk not in state[0]:
+        posts = list(context.get('page_obj') or [])
+        if post not in posts:
+            posts.append(post)
+        state = cards.get_cards(posts, variant)
+        thumbnails.prefetch(
+            [item for item in posts if item.pk not in state[1]]
+        )
+        context.render_context['post_cards'] = state
+    keys, found = state
+    html = found.get(post.pk)
+    if html is None:
+        card = context.template.engine.get_template(cards.CARD_TEMPLATE)
+        with context.push(post=post):
+            html = card.render(context)
+        cards.set_card(keys[post.pk], html)
+    return mark_safe(html)
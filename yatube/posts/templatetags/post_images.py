@@ -0,0 +1,70 @@
+from django import template
+from django.conf import settings
+from sorl.thumbnail import get_thumbnail
+
+from core import timing
+
+from .. import resize, thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image, geometry, **options):
+    """
+    Миниатюра картинки поста с опциями из POST_THUMBNAILS.
+
+    В асинхронном режиме отдаёт только готовую миниатюру, а пока её
+    нет - None, и шаблон показывает оригинал. Миниатюры, найденные
+    thumbnails.prefetch, повторно не ищутся.
+    """
+    if not image:
+        return None
+    prefetched = getattr(image.instance, '_prefetched_thumbnails', {})
+    if not options and geometry in prefetched and (
+        prefetched[geometry] is not None or settings.POST_THUMBNAILS_ASYNC
+    ):
+        return prefetched[geometry]
+    options = {**settings.POST_THUMBNAILS.get(geometry, {}), **options}
+    if settings.POST_THUMBNAILS_ASYNC:
+        return thumbnails.backend.get_cached_thumbnail(
+            image, geometry, **options
+        )
+    with timing.measure('thumbnail'):
+        return get_thumbnail(image, geometry, **options)
+
+
+@register.simple_tag
+def resized_url(image, geometry):
+    """Подписанная ссылка на копию картинки размера geometry (WxH)."""
+    if not image:
+        return ''
+    width, height = map(int, geometry.split('x'))
+    return resize.resize_url(image, width, height)
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post, geometry, lazy=False):
+    """
+    Картинка поста: миниатюра geometry и srcset из копий нескольких
+    ширин, чтобы узкие экраны не скачивали полный размер.
+    """
+    width, height = map(int, geometry.split('x'))
+    context = {
+        'post': post,
+        'thumbnail': post_thumbnail(post.image, geometry),
+        'width': width,
+        'height': height,
+        'lazy': lazy,
+        'sizes': settings.POST_IMAGE_SIZES,
+        'srcsets': {},
+    }
+    if post.image:
+        sizes = thumbnails.responsive_sizes(geometry)
+        for image_format in thumbnails.responsive_formats():
+            context['srcsets'][image_format or 'original'] = ', '.join(
+                f'{resize.resize_url(post.image, *size, image_format)} '
+                f'{size[0]}w'
+                for size in sizes
+            )
+    return context
@@ -0,0 +1,113 @@
+from http import HTTPStatus
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(POSTS_PER_PAGE=2)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.reader = User.objects.create_user(username='test_reader')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {num}', group=cls.group
+            )
+            for num in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_lists(self):
+        """Списки отдают посты по курсору без экземпляров моделей"""
+        expected = [post.pk for post in reversed(self.posts)]
+        urls = [
+            (self.client, reverse('posts:api_index')),
+            (self.client, reverse('posts:api_group_list', args=['test-slug'])),
+            (self.client, reverse('posts:api_profile', args=['test_name'])),
+            (self.reader_client, reverse('posts:api_follow_index')),
+        ]
+        for client, url in urls:
+            with self.subTest(url=url):
+                with mock.patch.object(
+                    Post, '__init__', side_effect=AssertionError
+                ):
+                    first = client.get(url).json()
+                self.assertEqual(first['results'][0], {
+                    'id': expected[0],
+                    'text': 'Пост 2',
+                    'pub_date': first['results'][0]['pub_date'],
+                    'author': 'test_name',
+                    'group': 'test-slug',
+                    'image': None,
+                    'comment_count': 0,
+                })
+                second = client.get(url, {'after': first['next']}).json()
+                rows = first['results'] + second['results']
+                self.assertEqual([row['id'] for row in rows], expected)
+                self.assertIsNone(second['next'])
+
+    def test_not_modified(self):
+        """Повтор с ETag - 304 за один запрос, правка меняет ETag"""
+        url = reverse('posts:api_index')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        post = self.posts[-1]
+        post.text = 'Исправленный пост'
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            response.json()['results'][0]['text'], 'Исправленный пост'
+        )
+
+    def test_post_detail(self):
+        """Пост отдаётся с ETag, несуществующий - 404"""
+        url = reverse('posts:api_post_detail', args=[self.posts[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['text'], 'Пост 0')
+        self.assertFalse(response['ETag'].startswith('W/'))
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.client.get(
+            reverse('posts:api_post_detail', args=[0])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_errors(self):
+        """Чужая группа - 404, лента без входа - 401"""
+        response = self.client.get(
+            reverse('posts:api_group_list', args=['missing'])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.get(reverse('posts:api_follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_deleted_owner_not_modified(self):
+        """ETag пустой страницы не прячет удаление группы за 304"""
+        group = Group.objects.create(title='Пустая', slug='empty')
+        url = reverse('posts:api_group_list', args=['empty'])
+        etag = self.client.get(url)['ETag']
+        group.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
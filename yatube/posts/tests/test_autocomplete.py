@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from .. import autocomplete
+from ..autocomplete import CompactPrefixIndex, PrefixIndex
+from ..models import Group
+
+User = get_user_model()
+
+
+def suggestions(client, prefix):
+    response = client.get(reverse('posts:autocomplete'), {'q': prefix})
+    return (
+        [user['username'] for user in response.json()['users']],
+        [group['slug'] for group in response.json()['groups']],
+    )
+
+
+class PrefixIndexTests(TestCase):
+    def test_search_add_discard(self):
+        """Оба индекса ищут по префиксу без учёта регистра и меняются"""
+        for index in (
+            PrefixIndex(['Bob', 'anton', 'Anna']),
+            CompactPrefixIndex(['Bob', 'anton', 'Anna'], merge_every=2),
+        ):
+            with self.subTest(index=type(index).__name__):
+                self.assertEqual(index.search('AN', 10), ['Anna', 'anton'])
+                index.add('Andrew')
+                index.add('Andrew')
+                self.assertEqual(
+                    index.search('an', 10), ['Andrew', 'Anna', 'anton']
+                )
+                index.discard('Anna')
+                index.add('Антон')
+                self.assertEqual(index.search('an', 10), ['Andrew', 'anton'])
+                self.assertEqual(index.search('ан', 10), ['Антон'])
+                self.assertEqual(index.search('', 2), ['Andrew', 'anton'])
+                self.assertEqual(len(index), 4)
+
+
+class AutocompleteViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User.objects.create_user(username='Leo')
+        User.objects.create_user(username='leon')
+        User.objects.create_user(username='max')
+        Group.objects.create(title='Лес', slug='les')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_answers_from_memory(self):
+        """Подсказки строятся одним запросом, дальше база не нужна"""
+        self.assertEqual(suggestions(self.client, 'le'), (
+            ['Leo', 'leon'], ['les']
+        ))
+        with self.assertNumQueries(0):
+            self.assertEqual(suggestions(self.client, 'LEO'), (
+                ['Leo', 'leon'], []
+            ))
+        response = self.client.get(
+            reverse('posts:autocomplete'), {'q': 'le', 'limit': 1}
+        )
+        self.assertEqual(response.json()['users'], [
+            {'username': 'Leo', 'url': reverse('posts:profile', args=['Leo'])}
+        ])
+        self.assertEqual(suggestions(self.client, ''), ([], []))
+
+
+class AutocompleteSignalTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_index_follows_changes(self):
+        """Создание, переименование и удаление меняют индекс без перестройки"""
+        user = User.objects.create_user(username='anna')
+        group = Group.objects.create(title='Аниме', slug='anime')
+        self.assertEqual(suggestions(self.client, 'an'), (['anna'], ['anime']))
+        user.username = 'hanna'
+        user.save()
+        User.objects.create_user(username='andrew')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                suggestions(self.client, 'an'), (['andrew'], ['anime'])
+            )
+            self.assertEqual(suggestions(self.client, 'h'), (['hanna'], []))
+        group.delete()
+        user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.assertEqual(suggestions(self.client, 'an'), (['andrew'], []))
+
+    def test_changes_of_other_process(self):
+        """Изменение счётчика другим процессом перестраивает индекс"""
+        User.objects.create_user(username='anna')
+        suggestions(self.client, 'an')
+        User.objects.filter(username='anna').update(username='andrew')
+        cache.incr(autocomplete.users.version_key)
+        with self.assertNumQueries(1):
+            self.assertEqual(suggestions(self.client, 'an'), (['andrew'], []))
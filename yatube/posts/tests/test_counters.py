@@ -0,0 +1,55 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from users.models import Profile
+from ..models import Comment, Follow, Post
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.reader = User.objects.create_user(username='test_reader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении записей."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        self.author.profile.refresh_from_db()
+        self.reader.profile.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.author.profile.post_count, 1)
+        self.assertEqual(self.author.profile.follower_count, 1)
+        self.assertEqual(self.reader.profile.following_count, 1)
+        self.assertEqual(post.comment_count, 1)
+        comment.delete()
+        self.reader.follower.all().delete()
+        post.delete()
+        self.author.profile.refresh_from_db()
+        self.reader.profile.refresh_from_db()
+        self.assertEqual(self.author.profile.post_count, 0)
+        self.assertEqual(self.author.profile.follower_count, 0)
+        self.assertEqual(self.reader.profile.following_count, 0)
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters исправляет рассинхронизацию."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Post.objects.filter(pk=post.pk).update(comment_count=7)
+        Profile.objects.filter(user=self.author).update(post_count=5)
+        Profile.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(
+            Profile.objects.get(user=self.author).post_count, 1
+        )
+        self.assertTrue(Profile.objects.filter(user=self.reader).exists())
@@ -1,19 +1,31 @@
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.conf import settings
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import SkipFile
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase, override_settings
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from http import HTTPStatus
+from PIL import Image
 
 from ..models import Post, Group, Comment
+from ..uploads import LimitedUploadHandler
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def content_name(content, extension):
+    digest = hashlib.sha256(content).hexdigest()
+    return f'posts/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormsTests(TestCase):
     @classmethod
@@ -78,7 +90,12 @@ class PostFormsTests(TestCase):
         self.assertEqual(Post.objects.count(), posts_count + 1)
         testing_post = Post.objects.first()
         self.assertEqual(testing_post.text, form_data['text'])
-        self.assertEqual(testing_post.image, 'posts/small.gif')
+        self.assertEqual(testing_post.image, content_name(small_gif, '.gif'))
+        self.assertEqual(
+            (testing_post.image_width, testing_post.image_height), (2, 1)
+        )
+        self.assertEqual(testing_post.image_format, 'GIF')
+        self.assertEqual(testing_post.image_size, len(small_gif))
         self.assertEqual(testing_post.group.pk, form_data['group'])
         self.assertEqual(testing_post.author, PostFormsTests.author)
         self.assertEqual(testing_post.group, PostFormsTests.group)
@@ -127,7 +144,7 @@ class PostFormsTests(TestCase):
         self.assertEqual(Post.objects.count(), posts_count)
         testing_post = Post.objects.get(pk=self.post.pk)
         self.assertEqual(testing_post.text, form_data['text'])
-        self.assertEqual(testing_post.image, 'posts/new.gif')
+        self.assertEqual(testing_post.image, content_name(new_gif, '.gif'))
         self.assertEqual(testing_post.group.pk, form_data['group'])
         self.assertNotEqual(testing_post.text, old_text)
         self.assertNotEqual(testing_post.group, old_group)
@@ -140,6 +157,84 @@ class PostFormsTests(TestCase):
         ).context
         self.assertEqual(len(old_group_posts['page_obj']), 0)
 
+    def test_backfill_image_metadata(self):
+        """Команда заполняет метаданные картинок старых постов"""
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        self.post.image = SimpleUploadedFile('old.gif', small_gif)
+        self.post.save()
+        # Картинка-бомба пропускается, а не обрывает команду.
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 0):
+            call_command('backfill_image_metadata', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertIsNone(self.post.image_width)
+        call_command('backfill_image_metadata', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (2, 1)
+        )
+        self.assertEqual(self.post.image_format, 'GIF')
+        self.assertEqual(self.post.image_size, len(small_gif))
+
+    def test_upload_limits(self):
+        """Слишком тяжёлые картинки и картинки-бомбы не принимаются"""
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        posts_count = Post.objects.count()
+        for limits in (
+            {'POST_IMAGE_MAX_BYTES': len(small_gif) - 1},
+            {'POST_IMAGE_MAX_PIXELS': 1},
+        ):
+            with self.subTest(limits=limits), override_settings(**limits):
+                response = self.author_client.post(
+                    reverse('posts:post_create'),
+                    data={
+                        'text': 'Пост с картинкой',
+                        'image': SimpleUploadedFile(
+                            'bomb.gif', small_gif, 'image/gif'
+                        ),
+                    }
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertTrue(response.context['form'].errors['image'])
+        self.assertEqual(Post.objects.count(), posts_count)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_upload_aborted_on_header(self):
+        """Разрешение проверяется по первому куску, до конца загрузки"""
+        buffer = BytesIO()
+        Image.effect_noise((400, 300), 64).save(buffer, 'JPEG')
+        content = buffer.getvalue()
+        request = RequestFactory().post('/')
+        handler = LimitedUploadHandler(request)
+        handler.new_file('image', 'big.jpg', 'image/jpeg', len(content))
+        with self.assertRaises(SkipFile):
+            handler.receive_data_chunk(content[:2048], 0)
+        self.assertEqual(
+            request.upload_errors['image'],
+            'Слишком большое разрешение картинки.'
+        )
+        handler = LimitedUploadHandler(request)
+        handler.new_file('image', 'big.jpg', 'image/jpeg', len(content))
+        with override_settings(POST_IMAGE_MAX_PIXELS=400 * 300):
+            for start in range(0, len(content), 2048):
+                chunk = content[start:start + 2048]
+                self.assertEqual(
+                    handler.receive_data_chunk(chunk, start), chunk
+                )
+
     def test_create_comment(self):
         """Проверяем создание комментария при отправке формы"""
         comment_count = Comment.objects.count()
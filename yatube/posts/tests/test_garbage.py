@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from ..models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGarbageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        caches['thumbnails'].clear()
+
+    def create_post(self, content):
+        return Post.objects.create(
+            author=MediaGarbageTests.author,
+            text='Пост с картинкой',
+            image=ContentFile(content, name='image.gif')
+        )
+
+    def write_file(self, name):
+        path = os.path.join(TEMP_MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(SMALL_GIF)
+        return path
+
+    def test_orphans_collected(self):
+        """Удаляются файлы и записи sorl без постов, нужные остаются"""
+        kept = self.create_post(SMALL_GIF)
+        kept_thumbnail = get_thumbnail(kept.image, '10x10')
+        deleted = self.create_post(OTHER_GIF)
+        deleted_original = deleted.image.path
+        deleted_thumbnail = get_thumbnail(deleted.image, '10x10')
+        deleted.delete()
+        orphan_original = self.write_file('posts/orphan.gif')
+        orphan_thumbnail = self.write_file(
+            sorl_settings.THUMBNAIL_PREFIX + 'aa/bb/orphan.gif'
+        )
+        young = self.write_file('posts/young.gif')
+        for path in (deleted_original, orphan_original, orphan_thumbnail):
+            os.utime(path, (0, 0))
+        orphans = [
+            deleted_original,
+            deleted_thumbnail.storage.path(deleted_thumbnail.name),
+            orphan_original,
+            orphan_thumbnail,
+        ]
+
+        call_command('collect_media_garbage', dry_run=True, stdout=StringIO())
+        for path in orphans:
+            self.assertTrue(os.path.exists(path))
+
+        call_command(
+            'collect_media_garbage', rate=0, min_age=60, stdout=StringIO()
+        )
+        for path in orphans:
+            with self.subTest(path=path):
+                self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(young))
+        self.assertTrue(os.path.exists(kept.image.path))
+        self.assertTrue(os.path.exists(
+            kept_thumbnail.storage.path(kept_thumbnail.name)
+        ))
+        self.assertIsNotNone(default.kvstore.get(kept_thumbnail))
+        self.assertIsNone(default.kvstore.get(deleted_thumbnail))
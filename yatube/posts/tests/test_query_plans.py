@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+LIST_TABLES = ('posts_post', 'posts_feeditem', 'posts_comment')
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.reader = User.objects.create_user(username='test_reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание группы',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for post_num in range(15):
+            post = Post.objects.create(
+                author=cls.author,
+                text='Тестовый пост' + str(post_num),
+                group=cls.group,
+            )
+        cls.post = post
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return ' | '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_views_use_indexes(self):
+        """Основные запросы страниц не сортируют через временное B-дерево."""
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?after=',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts:profile', kwargs={'username': self.author.username}
+            ),
+            reverse('posts:follow_index'),
+            reverse('posts:follow_index') + '?after=',
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:api_index'),
+            reverse('posts:api_group_list', args=[self.group.slug]),
+            reverse('posts:api_profile', args=[self.author.username]),
+            reverse('posts:api_follow_index'),
+        ]
+        for page in pages:
+            with self.subTest(page=page):
+                with CaptureQueriesContext(connection) as context:
+                    self.reader_client.get(page)
+                list_queries = [
+                    query['sql'] for query in context.captured_queries
+                    if 'ORDER BY' in query['sql']
+                    and any(
+                        f'FROM "{table}"' in query['sql']
+                        for table in LIST_TABLES
+                    )
+                ]
+                self.assertTrue(list_queries)
+                for sql in list_queries:
+                    plan = self.explain(sql)
+                    self.assertNotIn('TEMP B-TREE', plan, msg=sql)
+                    self.assertIn('INDEX', plan, msg=sql)
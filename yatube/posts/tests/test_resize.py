@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from http import HTTPStatus
+from PIL import Image, ImageOps
+
+from ..models import Post
+from ..resize import cache_path, resize, resize_url
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_CACHE_ROOT = os.path.join(TEMP_MEDIA_ROOT, 'resize-cache')
+
+
+def make_image(name, size=(40, 20)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    RESIZE_CACHE_ROOT=TEMP_CACHE_ROOT,
+    RESIZE_CACHE_CULL_INTERVAL=0
+)
+class ResizeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.post = Post.objects.create(
+            author=ResizeTests.author,
+            text='Пост с картинкой',
+            image=make_image('big.png')
+        )
+
+    def test_resize(self):
+        """Подписанная ссылка отдаёт картинку нужного размера из кэша"""
+        url = resize_url(self.post.image, 16, 16)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as im:
+            self.assertEqual(im.size, (16, 16))
+        cached = cache_path(self.post.image.name, 16, 16)
+        self.assertTrue(os.path.exists(cached))
+        os.remove(self.post.image.path)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.post.image.save('big.png', make_image('big.png'))
+        self.assertEqual(self.client.get(
+            resize_url(self.post.image, 16, 16)
+        ).status_code, HTTPStatus.OK)
+
+    def test_bad_signature(self):
+        """Чужой размер или подпись не ресайзятся"""
+        url = resize_url(self.post.image, 16, 16)
+        for bad_url in (
+            url.replace('16x16', '17x17'),
+            url.replace('/resize/', '/resize/0'),
+            resize_url(self.post.image, 5000, 5000),
+        ):
+            with self.subTest(url=bad_url):
+                response = self.client.get(bad_url)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_FOUND
+                )
+
+    def test_cache_eviction(self):
+        """Давно не читавшиеся копии вытесняются по размеру кэша"""
+        old = cache_path(self.post.image.name, 10, 10)
+        self.client.get(resize_url(self.post.image, 10, 10))
+        os.utime(old, (0, 0))
+        with override_settings(RESIZE_CACHE_MAX_SIZE=os.path.getsize(old)):
+            self.client.get(resize_url(self.post.image, 12, 12))
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(
+            os.path.exists(cache_path(self.post.image.name, 12, 12))
+        )
+
+    def test_variants_single_decode(self):
+        """Все копии делаются из одного открытия оригинала"""
+        variants = [(32, 16, ''), (16, 8, ''), (8, 4, '')]
+        with mock.patch(
+            'posts.resize.Image.open', wraps=Image.open
+        ) as image_open:
+            resize(self.post.image.name, variants)
+        self.assertEqual(image_open.call_count, 1)
+        for width, height, _ in variants:
+            with Image.open(
+                cache_path(self.post.image.name, width, height)
+            ) as image:
+                self.assertEqual(image.size, (width, height))
+
+    def test_draft_follows_exif_rotation(self):
+        """Уменьшенное декодирование учитывает поворот по EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes()
+        )
+        self.post.image.save('rotated.jpg', SimpleUploadedFile(
+            'rotated.jpg', buffer.getvalue()
+        ))
+        with mock.patch(
+            'posts.resize.ImageOps.fit', wraps=ImageOps.fit
+        ) as fit:
+            resize(self.post.image.name, [(192, 108, '')])
+        width, height = fit.call_args[0][0].size
+        self.assertGreaterEqual(width, 192)
+        self.assertLess(width, height)
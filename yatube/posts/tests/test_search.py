@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post
+from ..search import SearchPaginator
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_search_ranked_and_highlighted(self):
+        """Поиск находит посты по словам, выше - где слово чаще"""
+        rare = Post.objects.create(
+            author=SearchTests.author, text='Кошка спит на диване весь день'
+        )
+        often = Post.objects.create(
+            author=SearchTests.author, text='Кошка, кошка и ещё одна кошка'
+        )
+        Post.objects.create(author=SearchTests.author, text='Собака <b>')
+        page = SearchPaginator('КОШК', 10).get_page()
+        self.assertEqual(list(page), [often, rare])
+        self.assertIn('<mark>Кошка</mark>', page[0].snippet)
+        response = self.client.get(reverse('posts:search'), {'q': 'собака'})
+        self.assertContains(response, '<mark>Собака</mark> &lt;b&gt;')
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении поста"""
+        post = Post.objects.create(author=SearchTests.author, text='Старый')
+        Post.objects.filter(pk=post.pk).update(text='Новый текст')
+        self.assertEqual(list(SearchPaginator('старый', 10).get_page()), [])
+        self.assertEqual(
+            list(SearchPaginator('новый', 10).get_page()), [post]
+        )
+        post.delete()
+        self.assertEqual(list(SearchPaginator('новый', 10).get_page()), [])
+
+    @override_settings(POSTS_PER_PAGE=2)
+    def test_search_keyset_pagination(self):
+        """Страницы поиска идут по курсору без повторов"""
+        Post.objects.bulk_create([
+            Post(author=SearchTests.author, text='слово ' * (num % 3 + 1))
+            for num in range(5)
+        ])
+        found, after = [], None
+        while True:
+            response = self.client.get(
+                reverse('posts:search_api'), {'q': 'слово', 'after': after}
+                if after else {'q': 'слово'}
+            )
+            data = response.json()
+            found += [result['id'] for result in data['results']]
+            after = data['next']
+            if not after:
+                break
+        self.assertEqual(len(found), 5)
+        self.assertEqual(len(set(found)), 5)
+
+    def test_bad_query(self):
+        """Операторы FTS5 в запросе не ломают поиск"""
+        for query in ('"', 'NEAR(', '*', 'a AND OR', ''):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    reverse('posts:search'), {'q': query}
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_admin_search(self):
+        """Админка ищет по тому же индексу"""
+        post = Post.objects.create(author=SearchTests.author, text='Админ')
+        self.client.force_login(SearchTests.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'админ'}
+        )
+        self.assertEqual(list(response.context['cl'].result_list), [post])
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ..management.commands.rehome_images import Command as RehomeImages
+from ..models import Post, StoredImage
+from ..storage import image_storage, is_content_addressed
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name):
+        return Post.objects.create(
+            author=ContentAddressedStorageTests.author,
+            text='Пост с картинкой',
+            image=ContentFile(SMALL_GIF, name=name)
+        )
+
+    def test_identical_uploads_stored_once(self):
+        """Одинаковые картинки лежат в одном файле с числом ссылок"""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_content_addressed(first.image.name))
+        self.assertTrue(os.path.exists(first.image.path))
+        stored = StoredImage.objects.get(name=first.image.name)
+        self.assertEqual(stored.references, 2)
+        first.delete()
+        stored.refresh_from_db()
+        self.assertEqual(stored.references, 1)
+        self.assertTrue(os.path.exists(second.image.path))
+        second.image = ContentFile(b'GIF89a', name='other.gif')
+        second.save()
+        self.assertFalse(StoredImage.objects.filter(pk=stored.pk).exists())
+
+    def test_same_image_uploaded_again(self):
+        """Повторная загрузка той же картинки не добавляет ссылку"""
+        post = self.create_post('first.gif')
+        post.image = ContentFile(SMALL_GIF, name='again.gif')
+        post.save()
+        self.assertEqual(
+            StoredImage.objects.get(name=post.image.name).references, 1
+        )
+
+    def test_rehome_file_without_posts(self):
+        """Файл, с которого ушли все посты, не трогает чужие ссылки"""
+        post = self.create_post('first.gif')
+        old_name = 'posts/orphan.gif'
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(TEMP_MEDIA_ROOT, old_name), 'wb') as file:
+            file.write(SMALL_GIF)
+        self.assertTrue(RehomeImages().rehome(old_name))
+        self.assertEqual(
+            StoredImage.objects.get(name=post.image.name).references, 1
+        )
+        self.assertTrue(os.path.exists(post.image.path))
+
+    def test_rehome_images(self):
+        """Команда переносит старые файлы в хранилище по хэшу"""
+        old_name = 'posts/old.gif'
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(TEMP_MEDIA_ROOT, old_name), 'wb') as file:
+            file.write(SMALL_GIF)
+        posts = [
+            Post.objects.create(
+                author=ContentAddressedStorageTests.author,
+                text='Старый пост',
+                image=old_name
+            )
+            for _ in range(2)
+        ]
+        call_command('rehome_images', batch_size=1, stdout=StringIO())
+        for post in posts:
+            post.refresh_from_db()
+            self.assertTrue(is_content_addressed(post.image.name))
+            with post.image.open('rb') as image_file:
+                self.assertEqual(image_file.read(), SMALL_GIF)
+        self.assertEqual(
+            StoredImage.objects.get(name=posts[0].image.name).references, 2
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageDeleteTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_last_reference_deletes_file(self):
+        """Файл удаляется после коммита вместе с последней ссылкой"""
+        name = image_storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        path = image_storage.path(name)
+        self.assertTrue(os.path.exists(path))
+        image_storage.delete(name)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredImage.objects.exists())
@@ -0,0 +1,270 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from ..checks import check_thumbnail_queue
+from ..kvstore import KVStore
+from ..models import Post, StoredImage, ThumbnailTask
+from ..resize import cache_path
+from ..thumbnails import backend, generate, responsive_sizes
+from ..uploads import reencode
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    RESIZE_CACHE_ROOT=os.path.join(TEMP_MEDIA_ROOT, 'resize-cache')
+)
+class ThumbnailQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(ThumbnailQueueTests.author)
+        cache.clear()
+        caches['thumbnails'].clear()
+
+    def test_thumbnails_generated_in_background(self):
+        """Миниатюры создаются воркером, до этого показывается оригинал"""
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name='small.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif'
+                ),
+            }
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertQuerysetEqual(
+            ThumbnailTask.objects.filter(post=post),
+            [ThumbnailTask.ORIGINAL],
+            transform=lambda task: task.geometry
+        )
+        original = post.image.name
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        response = self.author_client.get(detail)
+        self.assertContains(response, post.image.url)
+        self.assertContains(response, 'width="2" height="1"')
+        call_command(
+            'generate_thumbnails', processes=1, once=True, stdout=StringIO()
+        )
+        self.assertFalse(ThumbnailTask.objects.exists())
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual(post.image_format, 'JPEG')
+        self.assertFalse(StoredImage.objects.filter(name=original).exists())
+        thumbnail = backend.get_cached_thumbnail(
+            post.image, '960x339', **settings.POST_THUMBNAILS['960x339']
+        )
+        self.assertIsNotNone(thumbnail)
+        response = self.author_client.get(detail)
+        self.assertContains(response, thumbnail.url)
+        self.assertContains(response, 'srcset=')
+        for width, height in responsive_sizes('960x339'):
+            self.assertTrue(os.path.exists(
+                cache_path(post.image.name, width, height)
+            ))
+        self.assertContains(
+            self.author_client.get(reverse('posts:index')), thumbnail.url
+        )
+
+    def test_original_reencoded(self):
+        """Оригинал уменьшается и перекодируется без метаданных"""
+        exif = Image.Exif()
+        exif[0x010e] = 'секрет'
+        buffer = BytesIO()
+        Image.new('RGB', (300, 100), 'red').save(buffer, 'PNG', exif=exif)
+        post = Post.objects.create(
+            author=ThumbnailQueueTests.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('big.png', buffer.getvalue())
+        )
+        with override_settings(POST_IMAGE_MAX_DIMENSION=150):
+            self.assertTrue(reencode(post))
+        post.refresh_from_db()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format),
+            (150, 50, 'JPEG')
+        )
+        with post.image.open('rb') as image_file, Image.open(
+            image_file
+        ) as image:
+            self.assertEqual(image.size, (150, 50))
+            self.assertTrue(image.info.get('progressive'))
+            self.assertFalse(image.getexif())
+
+    @override_settings(THUMBNAIL_TASK_ATTEMPTS=1)
+    def test_thumbnails_after_reencode_failure(self):
+        """Не вышло перекодировать - миниатюры делаются из оригинала"""
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name='small.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif'
+                ),
+            }
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        with mock.patch(
+            'posts.thumbnails.uploads.reencode', side_effect=OSError
+        ), self.assertLogs('posts.thumbnails', 'ERROR'):
+            call_command(
+                'generate_thumbnails', processes=1, once=True,
+                stdout=StringIO()
+            )
+        self.assertQuerysetEqual(
+            ThumbnailTask.objects.filter(post=post),
+            [ThumbnailTask.FAILED],
+            transform=lambda task: task.status
+        )
+        thumbnail = backend.get_cached_thumbnail(
+            post.image, '960x339', **settings.POST_THUMBNAILS['960x339']
+        )
+        self.assertIsNotNone(thumbnail)
+        self.assertTrue(post.image.name.endswith('.gif'))
+
+    def test_thumbnail_lookups_batched(self):
+        """Число запросов списка не зависит от числа постов с картинками"""
+        def queries_for(count):
+            Post.objects.all().delete()
+            for post_num in range(count):
+                Post.objects.create(
+                    author=ThumbnailQueueTests.author,
+                    text='Пост ' + str(post_num),
+                    image=f'posts/image{count}_{post_num}.jpg'
+                )
+            cache.clear()
+            caches['thumbnails'].clear()
+            with CaptureQueriesContext(connection) as context:
+                self.author_client.get(reverse('posts:index'))
+            return len(context.captured_queries)
+
+        self.assertEqual(queries_for(2), queries_for(8))
+
+    @override_settings(POST_IMAGE_REENCODE=False)
+    def test_worker_thumbnails_seen_by_other_process(self):
+        """Миниатюра воркера видна процессу, уже искавшему её до воркера"""
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name='small.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif'
+                ),
+            }
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertContains(
+            self.author_client.get(detail), 'width="2" height="1"'
+        )
+        # У воркера свой кэш в памяти, как у отдельного процесса.
+        worker_cache = LocMemCache('worker', {})
+        with mock.patch.object(
+            KVStore, 'cache', new=property(lambda kvstore: worker_cache)
+        ):
+            call_command(
+                'generate_thumbnails', processes=1, once=True,
+                stdout=StringIO()
+            )
+        thumbnail = backend.get_cached_thumbnail(
+            post.image, '960x339', **settings.POST_THUMBNAILS['960x339']
+        )
+        self.assertIsNotNone(thumbnail)
+        self.assertContains(self.author_client.get(detail), thumbnail.url)
+
+    def test_generate_single_decode(self):
+        """Миниатюра и копии для srcset - из одного открытия оригинала"""
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 600), 'red').save(buffer, 'JPEG')
+        post = Post.objects.create(
+            author=ThumbnailQueueTests.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('big.jpg', buffer.getvalue())
+        )
+        post.set_image_metadata(1200, 600, 'JPEG')
+        with mock.patch('PIL.Image.open', wraps=Image.open) as image_open:
+            generate(post, '960x339')
+        self.assertEqual(image_open.call_count, 1)
+        thumbnail = backend.get_cached_thumbnail(
+            post.image, '960x339', **settings.POST_THUMBNAILS['960x339']
+        )
+        self.assertEqual(thumbnail.size, [960, 339])
+        for width, height in responsive_sizes('960x339'):
+            with Image.open(cache_path(post.image.name, width, height)) as im:
+                self.assertEqual(im.size, (width, height))
+
+    @override_settings(POST_THUMBNAILS_ASYNC=False)
+    def test_inline_processing_timed(self):
+        """Без очереди обработка картинок попадает в Server-Timing"""
+        response = self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name='small.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif'
+                ),
+            }
+        )
+        self.assertIn('thumbnail;dur=', response['Server-Timing'])
+        post = Post.objects.get(text='Пост с картинкой')
+        response = self.author_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertIn('thumbnail;dur=', response['Server-Timing'])
+
+    def test_queue_requires_shared_cache(self):
+        """Очередь миниатюр с кэшем одного процесса - ошибка проверки"""
+        self.assertEqual(check_thumbnail_queue(None), [])
+        local = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}
+        with override_settings(CACHES=local):
+            self.assertEqual(
+                [error.id for error in check_thumbnail_queue(None)],
+                ['posts.E001']
+            )
+            with override_settings(POST_THUMBNAILS_ASYNC=False):
+                self.assertEqual(check_thumbnail_queue(None), [])
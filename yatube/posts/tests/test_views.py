@@ -1,7 +1,9 @@
 import shutil
 import tempfile
+from io import StringIO
 
 from django.conf import settings
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
@@ -9,8 +11,12 @@ from django.urls import reverse
 from django import forms
 from http import HTTPStatus
 from django.core.cache import cache
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date
 
-from ..models import Post, Group, Follow
+from users.models import Profile
+from ..counters import reconcile
+from ..models import Comment, Post, Group, Follow, FeedItem
 
 
 User = get_user_model()
@@ -214,6 +220,29 @@ class PostViewsTests(TestCase):
         ).context
         self.assertEqual(len(response_author['page_obj']), follow_count)
 
+    def test_feed_fan_out(self):
+        """Новый пост попадает в ленту подписчика, отписка её чистит."""
+        Follow.objects.create(user=self.user, author=PostViewsTests.author)
+        self.assertEqual(
+            FeedItem.objects.filter(user=self.user).count(), 1
+        )
+        new_post = Post.objects.create(
+            author=PostViewsTests.author,
+            text='Новый пост в ленте'
+        )
+        response = self.authorized_client.get(
+            reverse('posts:follow_index')
+        ).context
+        self.assertEqual(response['page_obj'][0], new_post)
+        self.assertEqual(len(response['page_obj']), 2)
+        self.authorized_client.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': PostViewsTests.author.username}
+            )
+        )
+        self.assertFalse(FeedItem.objects.filter(user=self.user).exists())
+
 
 class PostViewsPaginatorTests(TestCase):
     @classmethod
@@ -238,6 +267,7 @@ class PostViewsPaginatorTests(TestCase):
             settings.POSTS_PER_PAGE + settings.POSTS_PER_PAGE // 2
         )]
         Post.objects.bulk_create(cls.posts)
+        reconcile()
 
     def setUp(self):
         self.author_client = Client()
@@ -269,6 +299,72 @@ class PostViewsPaginatorTests(TestCase):
                     settings.POSTS_PER_PAGE // 2
                 )
 
+    def test_profile_without_counters(self):
+        """Недостающий профиль создаётся с пересчитанными счётчиками"""
+        Profile.objects.filter(user=self.author).delete()
+        response = self.author_client.get(
+            reverse('posts:profile', kwargs={'username': 'test_name'})
+            + '?page=2'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POSTS_PER_PAGE // 2
+        )
+        total = settings.POSTS_PER_PAGE + settings.POSTS_PER_PAGE // 2
+        self.assertContains(response, f'Всего постов: {total}')
+        self.assertContains(response, 'Подписчиков: 0')
+        reader = User.objects.create_user(username='reader')
+        Profile.objects.filter(user=reader).delete()
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertEqual(
+            Profile.objects.get(user=reader).following_count, 1
+        )
+        self.assertEqual(
+            Profile.objects.get(user=self.author).follower_count, 1
+        )
+
+    def test_cursor_paginator(self):
+        """Проверяем keyset-пагинацию ?after=/?before= в списках постов"""
+        tempate_pages = [
+            reverse('posts:index'),
+            reverse(
+                'posts:group_list',
+                kwargs={'slug': self.group.slug}
+            ),
+            reverse(
+                'posts:profile',
+                kwargs={'username': self.author.username}
+            )
+        ]
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        for page in tempate_pages:
+            with self.subTest(page=page):
+                first = self.author_client.get(page + '?after=').context
+                self.assertEqual(
+                    [post.pk for post in first['page_obj']],
+                    expected[:settings.POSTS_PER_PAGE]
+                )
+                self.assertFalse(first['page_obj'].has_previous())
+                second = self.author_client.get(
+                    page + '?after=' + first['page_obj'].next_cursor
+                ).context
+                self.assertEqual(
+                    [post.pk for post in second['page_obj']],
+                    expected[settings.POSTS_PER_PAGE:]
+                )
+                self.assertFalse(second['page_obj'].has_next())
+                back = self.author_client.get(
+                    page + '?before=' + second['page_obj'].previous_cursor
+                ).context
+                self.assertEqual(
+                    [post.pk for post in back['page_obj']],
+                    expected[:settings.POSTS_PER_PAGE]
+                )
+
 
 class PostViewsCacheTests(TestCase):
     @classmethod
@@ -294,9 +390,399 @@ class PostViewsCacheTests(TestCase):
         """Проверяем cache для index"""
         pages = reverse('posts:index')
         response = self.author_client.get(pages).content
-        self.post.delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response_cache = self.author_client.get(pages).content
         self.assertEqual(response_cache, response)
         cache.clear()
         response_clear = self.author_client.get(pages).content
         self.assertNotEqual(response_cache, response_clear)
+
+    def test_cache_invalidation(self):
+        """Изменения постов и подписок сбрасывают только свои теги"""
+        reader = User.objects.create_user(username='test_reader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        index = reverse('posts:index')
+        group = reverse(
+            'posts:group_list',
+            kwargs={'slug': PostViewsCacheTests.group.slug}
+        )
+        profile = reverse(
+            'posts:profile',
+            kwargs={'username': PostViewsCacheTests.author.username}
+        )
+        for page in (index, group, profile):
+            with self.subTest(page=page):
+                self.assertContains(
+                    self.author_client.get(page), 'Тестовый пост'
+                )
+        other = Group.objects.create(title='Другая', slug='other')
+        self.assertIsNone(self.author_client.get(group).context)
+        new_post = Post.objects.create(
+            author=PostViewsCacheTests.author,
+            text='Свежий пост',
+            group=other
+        )
+        for page in (index, profile):
+            with self.subTest(page=page):
+                self.assertContains(
+                    self.author_client.get(page), 'Свежий пост'
+                )
+        self.assertNotContains(self.author_client.get(group), 'Свежий пост')
+        new_post.group = PostViewsCacheTests.group
+        new_post.save()
+        self.assertContains(self.author_client.get(group), 'Свежий пост')
+        self.post.delete()
+        self.assertNotContains(self.author_client.get(index), 'Тестовый пост')
+        reader_client.get(reverse('posts:follow_index'))
+        Follow.objects.create(user=reader, author=PostViewsCacheTests.author)
+        self.assertContains(
+            reader_client.get(reverse('posts:follow_index')), 'Свежий пост'
+        )
+
+    def test_post_card_cache(self):
+        """Карточка поста берётся из кэша до изменения поста или автора"""
+        page = reverse(
+            'posts:group_list',
+            kwargs={'slug': PostViewsCacheTests.group.slug}
+        )
+        cache.clear()
+        self.assertContains(self.author_client.get(page), 'Тестовый пост')
+        Post.objects.filter(pk=self.post.pk).update(text='Изменённый пост')
+        self.assertContains(self.author_client.get(page), 'Тестовый пост')
+        self.post.refresh_from_db()
+        self.post.save()
+        self.assertContains(self.author_client.get(page), 'Изменённый пост')
+        author = PostViewsCacheTests.author
+        author.first_name = 'Новое имя'
+        author.save()
+        self.assertContains(self.author_client.get(page), 'Новое имя')
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class PostDetailCommentsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост', group=cls.group
+        )
+        cls.quiet_post = Post.objects.create(
+            author=cls.author, text='Пост без обсуждения', group=cls.group
+        )
+        commenters = [
+            User.objects.create_user(username=f'user{num}')
+            for num in range(4)
+        ]
+        # bulk_create не заполняет путь в ветке.
+        for num in range(8):
+            Comment.objects.create(
+                post=cls.post, author=commenters[num % 4],
+                text=f'Комментарий {num}'
+            )
+        Comment.objects.create(
+            post=cls.quiet_post, author=cls.author, text='Один'
+        )
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def test_detail_queries_do_not_grow(self):
+        """Страница поста не делает запрос на каждый комментарий"""
+        # Валидаторы, пост, корни веток и все ответы.
+        with self.assertNumQueries(4):
+            self.client.get(reverse('posts:post_detail', args=[self.post.pk]))
+        with self.assertNumQueries(4):
+            self.client.get(
+                reverse('posts:post_detail', args=[self.quiet_post.pk])
+            )
+
+    def test_comments_pages(self):
+        """На посте - последние комментарии, ранние - по курсору"""
+        expected = list(self.post.comments.order_by(
+            'pub_date', 'pk'
+        ).values_list('text', flat=True))
+        comments = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        ).context['comments']
+        pages = [[comment.text for comment in comments]]
+        url = reverse('posts:post_comments', args=[self.post.pk])
+        while comments.has_next():
+            comments = self.client.get(
+                url, {'after': comments.next_cursor}
+            ).context['comments']
+            pages.insert(0, [comment.text for comment in comments])
+        self.assertEqual(pages[-1], expected[-3:])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(
+            self.client.get(url, {'after': 'испорчен'}).status_code,
+            HTTPStatus.OK
+        )
+
+    def test_new_comments(self):
+        """Новые комментарии после курсора: фрагмент, JSON и 304"""
+        url = reverse('posts:new_comments', args=[self.post.pk])
+        since = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        ).context['comments_since']
+        response = self.client.get(url, {'since': since})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['X-Comments-Since'], since)
+        self.assertNotContains(response, 'Комментарий')
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, {'since': since}, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        for params in ({'since': since, 'format': 'json'}, {}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(
+                    url, params, HTTP_IF_NONE_MATCH=response['ETag']
+                ).status_code, HTTPStatus.OK)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Свежий'
+        )
+        data = self.client.get(
+            url, {'since': since, 'format': 'json'},
+            HTTP_IF_NONE_MATCH=response['ETag']
+        ).json()
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']], ['Свежий']
+        )
+        self.assertFalse(data['has_more'])
+        response = self.client.get(url)
+        self.assertContains(response, 'Комментарий 0')
+        self.assertEqual(response['X-Comments-More'], '1')
+
+    def test_new_comments_etag_from_database(self):
+        """ETag опроса меняется и без версии в кэше этого процесса"""
+        url = reverse('posts:new_comments', args=[self.post.pk])
+        etag = self.client.get(url)['ETag']
+        # bulk_create не шлёт сигналов - как комментарий другого процесса.
+        Comment.objects.bulk_create([Comment(
+            post=self.post, author=self.author, text='Из другого процесса'
+        )])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_add_comment_ajax(self):
+        """AJAX-комментарий возвращает только свой фрагмент"""
+        self.client.force_login(self.author)
+        url = reverse('posts:add_comment', args=[self.post.pk])
+        response = self.client.post(
+            url, {'text': 'Через AJAX'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertContains(
+            response, 'Через AJAX', status_code=HTTPStatus.CREATED
+        )
+        self.assertNotContains(
+            response, 'Тестовый пост', status_code=HTTPStatus.CREATED
+        )
+        response = self.client.post(
+            url, {'text': ''}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('text', response.json()['errors'])
+
+    def test_threads(self):
+        """Ответы выводятся под родителем, все уровни - одним запросом"""
+        root = self.quiet_post.comments.get()
+        client = Client()
+        client.force_login(self.author)
+        url = reverse('posts:add_comment', args=[self.quiet_post.pk])
+        parent = root
+        for level in range(1, 4):
+            client.post(url, {'text': f'Уровень {level}', 'parent': parent.pk})
+            parent = Comment.objects.get(text=f'Уровень {level}')
+            self.assertEqual(parent.depth, level)
+        client.post(url, {'text': 'Второй ответ', 'parent': root.pk})
+        Comment.objects.create(
+            post=self.quiet_post, author=self.author, text='Новая ветка'
+        )
+        expected = [
+            'Один', 'Уровень 1', 'Уровень 2', 'Уровень 3', 'Второй ответ',
+            'Новая ветка'
+        ]
+        with self.assertNumQueries(4):
+            comments = self.client.get(
+                reverse('posts:post_detail', args=[self.quiet_post.pk])
+            ).context['comments']
+            self.assertEqual([c.text for c in comments], expected)
+        thread = self.client.get(reverse(
+            'posts:comment_thread', args=[self.quiet_post.pk, parent.parent_id]
+        )).context['comments']
+        self.assertEqual(
+            [c.text for c in thread], ['Уровень 2', 'Уровень 3']
+        )
+        response = client.post(url, {'text': 'Чужой', 'parent': self.post.pk})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @override_settings(COMMENT_REPLIES_PER_THREAD=2)
+    def test_replies_limited_per_thread(self):
+        """Под веткой - первые ответы и ссылка на всю ветку"""
+        root = self.quiet_post.comments.get()
+        parent = root
+        for level in range(1, 4):
+            parent = Comment.objects.create(
+                post=self.quiet_post, author=self.author,
+                text=f'Уровень {level}', parent=parent
+            )
+        other = Comment.objects.create(
+            post=self.quiet_post, author=self.author, text='Новая ветка'
+        )
+        Comment.objects.create(
+            post=self.quiet_post, author=self.author, text='Ответ',
+            parent=other
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.quiet_post.pk])
+        )
+        comments = response.context['comments']
+        self.assertEqual(
+            [c.text for c in comments],
+            ['Один', 'Уровень 1', 'Уровень 2', 'Новая ветка', 'Ответ']
+        )
+        self.assertEqual(comments[2].more_replies, root)
+        self.assertFalse(hasattr(comments[4], 'more_replies'))
+        self.assertContains(response, reverse(
+            'posts:comment_thread', args=[self.quiet_post.pk, root.pk]
+        ) + '">ещё ответы', count=1)
+
+    def test_fill_paths(self):
+        """Комментарии из bulk_create получают пути и попадают в ветки"""
+        Comment.objects.bulk_create([Comment(
+            post=self.quiet_post, author=self.author, text='Ветка'
+        )])
+        root = Comment.objects.get(text='Ветка')
+        Comment.objects.bulk_create([Comment(
+            post=self.quiet_post, author=self.author, text='Ответ',
+            parent=root
+        )])
+        out = StringIO()
+        call_command('fill_comment_paths', stdout=out)
+        self.assertIn('Заполнено путей: 2', out.getvalue())
+        root.refresh_from_db()
+        reply = Comment.objects.get(text='Ответ')
+        self.assertEqual(root.path, root.build_path())
+        self.assertEqual(reply.path, reply.build_path())
+        self.assertTrue(reply.path.startswith(root.path))
+        comments = self.client.get(
+            reverse('posts:post_detail', args=[self.quiet_post.pk])
+        ).context['comments']
+        self.assertEqual(
+            [c.text for c in comments], ['Один', 'Ветка', 'Ответ']
+        )
+
+    def test_max_depth(self):
+        """Ответы глубже MAX_DEPTH остаются на последнем уровне"""
+        parent = self.quiet_post.comments.get()
+        for _ in range(Comment.MAX_DEPTH + 2):
+            parent = Comment.objects.create(
+                post=self.quiet_post, author=self.author, text='Ответ',
+                parent=parent
+            )
+        self.assertEqual(parent.depth, Comment.MAX_DEPTH - 1)
+        self.assertLessEqual(
+            len(parent.path), Comment._meta.get_field('path').max_length
+        )
+
+
+class ConditionalViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост', group=cls.group
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        cache.clear()
+
+    def test_post_detail_not_modified(self):
+        """Страница поста отдаёт 304, пока пост и комментарии те же"""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertNotEqual(
+            self.author_client.get(url)['ETag'], etag,
+            'Автор видит кнопку правки - у него своя версия страницы'
+        )
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий'
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+        updated_at = Post.objects.get(pk=self.post.pk).updated_at
+        self.author_client.post(
+            reverse('posts:post_edit', args=[self.post.pk]),
+            {'text': 'Исправленный пост', 'group': self.group.pk}
+        )
+        self.assertGreater(
+            Post.objects.get(pk=self.post.pk).updated_at, updated_at
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Исправленный пост')
+
+    def test_post_detail_etag_follows_csrf_cookie(self):
+        """Новый CSRF-токен зрителя - новая страница, а не 304 со старым"""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        etag = self.author_client.get(url)['ETag']
+        response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.author_client.cookies[settings.CSRF_COOKIE_NAME] = (
+            get_random_string(64)
+        )
+        response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_lists_not_modified(self):
+        """Профиль и группа отдают 304 без запросов к базе"""
+        for url in (
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:group_list', args=[self.group.slug]),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    response['Last-Modified'],
+                    http_date(self.post.updated_at.timestamp())
+                )
+                with self.assertNumQueries(0):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+                response = self.client.get(
+                    url,
+                    HTTP_IF_MODIFIED_SINCE=http_date(
+                        self.post.updated_at.timestamp()
+                    )
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+        etag = self.client.get(
+            reverse('posts:profile', args=[self.author.username])
+        )['ETag']
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(
+            reverse('posts:profile', args=[self.author.username]),
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertContains(response, 'Новый пост')
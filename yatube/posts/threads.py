@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment
+
+# Больше любой цифры base36: path < prefix + PATH_END - всё поддерево.
+PATH_END = '~'
+# Комментарии диапазона, от которых до корня их ветки не больше %s строк.
+# Окно идёт в порядке индекса (post, path), без PARTITION BY и сортировки:
+# последний корень в рамке - корень своей ветки, если он там вообще есть.
+# Через extra: pk__in=RawSQL даёт IN ((...)), а это в SQLite одно значение.
+THREAD_HEADS = f'''
+{Comment._meta.db_table}.id IN (SELECT id FROM (
+    SELECT id, MAX(
+        CASE WHEN length(path) = {Comment.PATH_STEP} THEN path END
+    ) OVER (
+        ORDER BY path ROWS BETWEEN %s PRECEDING AND CURRENT ROW
+    ) AS root
+    FROM {Comment._meta.db_table}
+    WHERE post_id = %s AND path >= %s AND path < %s
+) WHERE root IS NOT NULL)
+'''
+
+
+def subtree(comment):
+    """Комментарий со всеми ответами в порядке обхода, одним запросом."""
+    return Comment.objects.filter(
+        post_id=comment.post_id,
+        path__gte=comment.path,
+        path__lt=comment.path + PATH_END,
+    ).select_related('author').order_by('path')
+
+
+def with_replies(roots):
+    """
+    Корни веток с первыми ответами всех уровней в порядке обхода.
+
+    Корни страницы идут подряд по path, поэтому их ветки - один
+    диапазон индекса (post, path); затесавшиеся чужие ветки
+    отбрасываются. От ветки берётся не больше
+    COMMENT_REPLIES_PER_THREAD ответов; у последнего показанного
+    more_replies - корень, по нему шаблон ссылается на всю ветку.
+    """
+    if not roots:
+        return []
+    limit = settings.COMMENT_REPLIES_PER_THREAD
+    paths = sorted(root.path for root in roots)
+    start, end = paths[0], paths[-1] + PATH_END
+    comments = Comment.objects.filter(
+        post_id=roots[0].post_id, path__gte=start, path__lt=end,
+    ).extra(
+        # Корень, limit ответов и ещё один - узнать, что есть продолжение.
+        where=[THREAD_HEADS], params=[limit + 1, roots[0].post_id, start, end]
+    ).select_related('author').order_by('path')
+    wanted = set(paths)
+    shown = []
+    threads = {}
+    for comment in comments:
+        prefix = comment.path[:Comment.PATH_STEP]
+        if prefix not in wanted:
+            continue
+        if comment.path == prefix:
+            threads[prefix] = [comment]
+        elif len(threads[prefix]) > limit:
+            threads[prefix][-1].more_replies = threads[prefix][0]
+            continue
+        else:
+            threads[prefix].append(comment)
+        shown.append(comment)
+    return shown
+
+
+def fill_paths(using='default'):
+    """
+    Заполняет пустые пути (bulk_create, loaddata) уровень за уровнем:
+    путь ответа строится из пути родителя. Возвращает число комментариев.
+    """
+    filled = 0
+    comments = Comment.objects.using(using).filter(path='')
+    while True:
+        level = list(comments.filter(
+            Q(parent=None) | ~Q(parent__path='')
+        ).select_related('parent'))
+        if not level:
+            return filled
+        for comment in level:
+            comment.path = comment.build_path()
+        Comment.objects.using(using).bulk_update(level, ['path'])
+        filled += len(level)
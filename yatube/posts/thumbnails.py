@@ -0,0 +1,273 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core import timing
+
+from . import resize, tags, uploads
+from .models import ThumbnailTask
+
+logger = logging.getLogger(__name__)
+
+
+class CachedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет только искать готовые миниатюры."""
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Миниатюра из KV-хранилища sorl или None, без генерации."""
+        if not file_:
+            return None
+        return default.kvstore.get(
+            self._thumbnail_file(file_, geometry_string, options)
+        )
+
+    def get_cached_thumbnails(self, items):
+        """
+        Пакетный вариант get_cached_thumbnail.
+
+        items - список (файл, размер, опции); хранилище с get_many
+        отвечает на весь список одним чтением.
+        """
+        files = [
+            self._thumbnail_file(file_, geometry_string, dict(options))
+            for file_, geometry_string, options in items
+        ]
+        if hasattr(default.kvstore, 'get_many'):
+            return default.kvstore.get_many(files)
+        return [default.kvstore.get(image_file) for image_file in files]
+
+    def create_thumbnail(self, file_, geometry_string, source_image,
+                         **options):
+        """
+        get_thumbnail по уже открытой картинке source_image.
+
+        sorl сам открыл бы оригинал ещё раз; здесь картинку декодируют
+        один раз на миниатюру и копии. Размер оригинала в KV-хранилище
+        берётся из файла, а не из source_image, которая может быть
+        декодирована в уменьшенном масштабе.
+        """
+        thumbnail = self._thumbnail_file(file_, geometry_string, options)
+        if default.kvstore.get(thumbnail):
+            return thumbnail
+        if not thumbnail.exists():
+            options['image_info'] = default.engine.get_image_info(
+                source_image
+            )
+            self._create_thumbnail(
+                source_image, geometry_string, options, thumbnail
+            )
+            self._create_alternative_resolutions(
+                source_image, geometry_string, options, thumbnail.name
+            )
+        source = default.kvstore.get_or_set(ImageFile(file_))
+        default.kvstore.set(thumbnail, source)
+        return thumbnail
+
+    def _thumbnail_file(self, file_, geometry_string, options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+backend = CachedThumbnailBackend()
+
+
+def prefetch(posts):
+    """
+    Находит готовые миниатюры всех постов одним чтением KV-хранилища.
+
+    Результат сохраняется в post._prefetched_thumbnails, его использует
+    тег post_thumbnail.
+    """
+    items, targets = [], []
+    for post in posts:
+        post._prefetched_thumbnails = {}
+        if not post.image:
+            continue
+        for geometry, options in settings.POST_THUMBNAILS.items():
+            items.append((post.image, geometry, options))
+            targets.append((post, geometry))
+    if not items:
+        return
+    found = backend.get_cached_thumbnails(items)
+    for (post, geometry), thumbnail in zip(targets, found):
+        post._prefetched_thumbnails[geometry] = thumbnail
+
+
+def responsive_sizes(geometry):
+    """Размеры копий для srcset: POST_IMAGE_WIDTHS в пропорциях geometry."""
+    width, height = map(int, geometry.split('x'))
+    return [
+        (size, round(height * size / width))
+        for size in settings.POST_IMAGE_WIDTHS
+        if size <= width
+    ]
+
+
+def responsive_formats():
+    """Форматы копий для srcset: как у оригинала и, если включён, WebP."""
+    formats = ['']
+    if settings.POST_IMAGE_WEBP and resize.format_available('webp'):
+        formats.append('webp')
+    return formats
+
+
+def enqueue(post):
+    """
+    Ставит в очередь обработку новой картинки поста: перекодирование
+    оригинала, если включено POST_IMAGE_REENCODE, а после него - все
+    размеры миниатюр из POST_THUMBNAILS.
+    """
+    if not post.image:
+        return
+    if not settings.POST_THUMBNAILS_ASYNC:
+        if settings.POST_IMAGE_REENCODE:
+            with timing.measure('thumbnail'):
+                uploads.reencode(post)
+        return
+    geometries = (
+        [ThumbnailTask.ORIGINAL] if settings.POST_IMAGE_REENCODE
+        else settings.POST_THUMBNAILS
+    )
+    _create_tasks(post, geometries)
+
+
+def _create_tasks(post, geometries):
+    ThumbnailTask.objects.bulk_create([
+        ThumbnailTask(post=post, image=post.image.name, geometry=geometry)
+        for geometry in geometries
+    ])
+
+
+def claim():
+    """Забирает задачу из очереди; гонку решает условный UPDATE."""
+    while True:
+        pk = ThumbnailTask.objects.filter(
+            status=ThumbnailTask.PENDING
+        ).values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        claimed = ThumbnailTask.objects.filter(
+            pk=pk, status=ThumbnailTask.PENDING
+        ).update(status=ThumbnailTask.RUNNING, updated_at=timezone.now())
+        if claimed:
+            return ThumbnailTask.objects.select_related(
+                'post__author', 'post__group'
+            ).get(pk=pk)
+
+
+def process(task):
+    """
+    Перекодирует оригинал или генерирует миниатюру с копиями для srcset,
+    сбрасывает кэш страниц с постом. Если перекодирование не удалось
+    окончательно, миниатюры делаются из исходного оригинала.
+    """
+    post = task.post
+    if post.image.name != task.image:
+        task.delete()
+        return
+    try:
+        if task.geometry == ThumbnailTask.ORIGINAL:
+            uploads.reencode(post)
+        else:
+            generate(post, task.geometry)
+    except Exception:
+        logger.exception('Thumbnail %s failed', task)
+        task.attempts += 1
+        task.status = (
+            ThumbnailTask.FAILED
+            if task.attempts >= settings.THUMBNAIL_TASK_ATTEMPTS
+            else ThumbnailTask.PENDING
+        )
+        task.save(update_fields=['attempts', 'status', 'updated_at'])
+        if (
+            task.status == ThumbnailTask.FAILED
+            and task.geometry == ThumbnailTask.ORIGINAL
+        ):
+            _create_tasks(post, settings.POST_THUMBNAILS)
+        return
+    task.delete()
+    if task.geometry == ThumbnailTask.ORIGINAL:
+        _create_tasks(post, settings.POST_THUMBNAILS)
+    tags.invalidate_post(post)
+
+
+def generate(post, geometry):
+    """Миниатюра geometry и копии для srcset картинки поста."""
+    with timing.measure('thumbnail'):
+        seed_source(post)
+        sizes = responsive_sizes(geometry)
+        variants = [
+            (width, height, image_format)
+            for width, height in sizes
+            for image_format in responsive_formats()
+        ]
+        # Миниатюра и все копии для srcset - из одного декодирования.
+        sizes.append(tuple(map(int, geometry.split('x'))))
+        with resize.decoded(post.image.name, sizes) as image:
+            backend.create_thumbnail(
+                post.image, geometry, image,
+                **settings.POST_THUMBNAILS[geometry]
+            )
+            if variants:
+                resize.resize_image(image, post.image.name, variants)
+        if variants:
+            resize.cull()
+
+
+def seed_source(post):
+    """
+    Кладёт размеры оригинала из метаданных поста в KV-хранилище sorl.
+
+    Если миниатюра уже лежит в хранилище, sorl не декодирует оригинал,
+    но открывает его ради размеров; с готовой записью это не нужно.
+    """
+    if not post.image_width or not post.image_height:
+        return
+    source = ImageFile(post.image)
+    source.set_size((post.image_width, post.image_height))
+    default.kvstore.get_or_set(source)
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, брошенные упавшими воркерами."""
+    return ThumbnailTask.objects.filter(
+        status=ThumbnailTask.RUNNING,
+        updated_at__lt=timezone.now() - timedelta(
+            seconds=settings.THUMBNAIL_TASK_TIMEOUT
+        )
+    ).update(status=ThumbnailTask.PENDING)
+
+
+def queue_metrics():
+    """Длина очереди миниатюр по статусам для /metrics."""
+    depth = dict(
+        ThumbnailTask.objects.order_by().values_list('status').annotate(
+            Count('pk')
+        )
+    )
+    return [(
+        'yatube_thumbnail_queue_depth',
+        'gauge',
+        'Thumbnail tasks by status.',
+        [
+            ({'status': status}, depth.get(status, 0))
+            for status, _ in ThumbnailTask.STATUSES
+        ],
+    )]
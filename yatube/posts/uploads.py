@@ -0,0 +1,137 @@
+import math
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Post
+
+QUALITY = 85
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp'}
+# Сколько начала файла копить ради размеров из заголовка: EXIF и ICC
+# перед ними обычно укладываются в 64 КБ каждый.
+HEADER_BYTES = 256 * 1024
+HEADER_ERRORS = (OSError, EOFError, SyntaxError, ValueError)
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """
+    Обрывает приём файла, как только он превысил POST_IMAGE_MAX_BYTES
+    или в заголовке картинки больше POST_IMAGE_MAX_PIXELS пикселей.
+
+    Остаток файла вычитывается без сохранения, поэтому ни память, ни
+    диск не растут. Ошибка попадает в request.upload_errors, её
+    показывает форма. Заголовок, который не удалось разобрать, проверит
+    форма по всему файлу.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.reject(
+                'Файл больше '
+                f'{settings.POST_IMAGE_MAX_BYTES // (1024 * 1024)} МБ.'
+            )
+        if self.header is not None:
+            self.header += raw_data
+            size = header_size(self.header)
+            if size is not None or len(self.header) >= HEADER_BYTES:
+                self.header = None
+            if size is not None and too_many_pixels(*size):
+                self.reject('Слишком большое разрешение картинки.')
+        return raw_data
+
+    def reject(self, message):
+        errors = self.request.__dict__.setdefault('upload_errors', {})
+        errors[self.field_name] = message
+        raise SkipFile
+
+    def file_complete(self, file_size):
+        return None
+
+
+def too_many_pixels(width, height):
+    return width * height > settings.POST_IMAGE_MAX_PIXELS
+
+
+def header_size(data):
+    """Размеры картинки из начала файла или None, если их там ещё нет."""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        # Больше предела самого Pillow - заведомо больше нашего.
+        return math.inf, math.inf
+    except HEADER_ERRORS:
+        return None
+
+
+def reencode(post):
+    """
+    Заменяет оригинал картинки поста перекодированной копией.
+
+    Копия без метаданных (EXIF, ICC), с длинной стороной не больше
+    POST_IMAGE_MAX_DIMENSION, в формате POST_IMAGE_FORMAT (JPEG -
+    прогрессивный). Анимированные картинки не трогаем. Возвращает
+    True, если оригинал заменён.
+    """
+    name = post.image.name
+    with post.image.open('rb') as source, Image.open(source) as image:
+        # Размеры известны из заголовка: проверяем до декодирования.
+        if too_many_pixels(image.width, image.height):
+            raise ValueError(f'{name}: {image.width}x{image.height}')
+        if getattr(image, 'is_animated', False):
+            return False
+        limit = settings.POST_IMAGE_MAX_DIMENSION
+        image.draft('RGB', (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        image_format = settings.POST_IMAGE_FORMAT
+        data = BytesIO()
+        _flatten(image).save(
+            data, image_format, quality=QUALITY, optimize=True,
+            progressive=True
+        )
+    storage = post.image.storage
+    stem = os.path.splitext(os.path.basename(name))[0]
+    post.image.save(
+        stem + EXTENSIONS[image_format], ContentFile(data.getvalue()),
+        save=False
+    )
+    # Условный UPDATE: если картинку успели поменять, копия не нужна.
+    updated = Post.objects.filter(pk=post.pk, image=name).update(
+        image=post.image.name,
+        image_width=image.width,
+        image_height=image.height,
+        image_format=image_format,
+        image_size=len(data.getvalue()),
+        updated_at=timezone.now()
+    )
+    if not updated:
+        storage.delete(post.image.name)
+        post.image.name = name
+        return False
+    storage.delete(name)
+    post.set_image_metadata(
+        image.width, image.height, image_format, len(data.getvalue())
+    )
+    return True
+
+
+def _flatten(image):
+    """Картинка в RGB; прозрачные места заливаются белым."""
+    if image.mode in ('RGB', 'L'):
+        return image
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -10,12 +11,51 @@ urlpatterns = [
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path(
+        'posts/<int:post_id>/comments/<int:comment_id>/',
+        views.comment_thread,
+        name='comment_thread'
+    ),
+    path(
+        'posts/<int:post_id>/comments/new/',
+        views.new_comments,
+        name='new_comments'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
         name='add_comment'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
+    path('api/search/', views.search_api, name='search_api'),
+    path(
+        'api/autocomplete/',
+        views.autocomplete,
+        name='autocomplete'
+    ),
+    path('api/v1/posts/', api.index, name='api_index'),
+    path(
+        'api/v1/posts/<int:post_id>/',
+        api.post_detail,
+        name='api_post_detail'
+    ),
+    path(
+        'api/v1/group/<slug>/',
+        api.group_posts,
+        name='api_group_list'
+    ),
+    path(
+        'api/v1/profile/<str:username>/',
+        api.profile,
+        name='api_profile'
+    ),
+    path('api/v1/follow/', api.follow_index, name='api_follow_index'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -26,4 +66,16 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path(
+        settings.MEDIA_URL.lstrip('/')
+        + 'resize/<signature>/<int:width>x<int:height>/<path:path>',
+        views.resize_image,
+        name='resize_image'
+    ),
+    path(
+        settings.MEDIA_URL.lstrip('/') + 'resize/<signature>/'
+        '<int:width>x<int:height>.<slug:image_format>/<path:path>',
+        views.resize_image,
+        name='resize_image'
+    ),
 ]
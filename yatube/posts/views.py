@@ -1,28 +1,74 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.middleware.csrf import get_token
 from .forms import PostForm, CommentForm
-from .models import Post, Group, User, Follow
+from .models import Comment, Post, Group, User, Follow
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.http import http_date
+from http import HTTPStatus
+import hashlib
+from core.cache import cache_tagged, tag_versions
+from . import (
+    autocomplete as prefix_index, cards, counters, resize, thumbnails
+)
+from .search import SearchPaginator
+from .threads import subtree, with_replies
+from .pagination import CursorPaginator
+from .storage import image_storage
 
 
-def paginator(request, post_list):
+def paginator(request, post_list, id_field='pk', count=None):
+    if (
+        settings.POSTS_CURSOR_PAGINATION
+        or 'after' in request.GET
+        or 'before' in request.GET
+    ):
+        paginator = CursorPaginator(
+            post_list, settings.POSTS_PER_PAGE, id_field=id_field
+        )
+        return paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before')
+        )
     paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
+    if count is not None:
+        paginator.count = count
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
 
 
-@cache_page(20, key_prefix='index_page')
+def with_last_modified(response, posts):
+    """
+    Last-Modified - последняя правка постов страницы.
+
+    Удаления и счётчики он не видит, поэтому главный валидатор - ETag
+    из cache_tagged; Last-Modified - для клиентов без If-None-Match.
+    """
+    dates = [post.updated_at for post in posts]
+    if dates:
+        response['Last-Modified'] = http_date(max(dates).timestamp())
+    return response
+
+
+@cache_tagged(lambda request: ['index', f'follow:{request.user.pk}'])
 def index(request):
     template = 'posts/index.html'
     post_list = Post.objects.select_related('author').all()
+    if request.user.is_authenticated:
+        counters.ensure_profile(request.user)
     context = {
         'page_obj': paginator(request, post_list),
     }
     return render(request, template, context)
 
 
+@cache_tagged(lambda request, slug: [f'group:{slug}'])
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
@@ -31,31 +77,192 @@ def group_posts(request, slug):
         'group': group,
         'page_obj': paginator(request, post_list),
     }
-    return render(request, template, context)
+    return with_last_modified(
+        render(request, template, context), context['page_obj']
+    )
 
 
+@cache_tagged(lambda request, username: [f'profile:{username}'])
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('profile'), username=username
+    )
     posts_list = author.posts.select_related('group').all()
     following = False
     if request.user.is_authenticated:
         following = request.user.follower.filter(author=author).exists()
     context = {
         'author': author,
-        'page_obj': paginator(request, posts_list),
+        'page_obj': paginator(
+            request, posts_list,
+            count=counters.ensure_profile(author).post_count
+        ),
         'following': following
     }
+    return with_last_modified(
+        render(request, template, context), context['page_obj']
+    )
+
+
+def search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': SearchPaginator(
+            query, settings.POSTS_PER_PAGE
+        ).get_page(after=request.GET.get('after')),
+    }
     return render(request, template, context)
 
 
+def search_api(request):
+    page_obj = SearchPaginator(
+        request.GET.get('q', ''), settings.POSTS_PER_PAGE
+    ).get_page(after=request.GET.get('after'))
+    return JsonResponse({
+        'results': [
+            {
+                'id': post.pk,
+                'url': reverse('posts:post_detail', args=[post.pk]),
+                'author': post.author.username,
+                'group': post.group.slug if post.group_id else None,
+                'pub_date': post.pub_date,
+                'snippet': post.snippet,
+            }
+            for post in page_obj
+        ],
+        'next': page_obj.next_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def autocomplete(request):
+    prefix = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET['limit']), settings.AUTOCOMPLETE_LIMIT)
+    except (KeyError, ValueError):
+        limit = settings.AUTOCOMPLETE_LIMIT
+    if not prefix or limit < 1:
+        usernames, slugs = [], []
+    else:
+        usernames = prefix_index.users.search(prefix, limit)
+        slugs = prefix_index.groups.search(prefix, limit)
+    return JsonResponse({
+        'users': [
+            {
+                'username': username,
+                'url': reverse('posts:profile', args=[username]),
+            }
+            for username in usernames
+        ],
+        'groups': [
+            {'slug': slug, 'url': reverse('posts:group_list', args=[slug])}
+            for slug in slugs
+        ],
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def comment_page(request, post):
+    """
+    Страница веток комментариев поста: курсор ведёт к более ранним.
+
+    Запрос корней и один запрос всех ответов, сколько бы ни было
+    уровней.
+    """
+    page_obj = CursorPaginator(
+        post.comments.filter(parent=None), settings.COMMENTS_PER_PAGE
+    ).get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before')
+    )
+    # Курсор идёт от новых к старым, показываем - по времени.
+    page_obj.object_list = with_replies(page_obj.object_list[::-1])
+    return page_obj
+
+
+def csrf_cookie(request):
+    """Секрет CSRF зрителя с формой; get_token сам маскирует по-новому."""
+    if not request.user.is_authenticated:
+        return ''
+    get_token(request)
+    return request.META['CSRF_COOKIE']
+
+
+def post_validators(request, post_id):
+    """
+    ETag и дата изменения страницы поста, один запрос на весь запрос.
+
+    Дата - правка поста или новый комментарий. В ETag ещё версии
+    автора, группы и комментариев (их меняют сигналы), тег профиля
+    автора (число постов) и зритель: ему видны свои кнопки, а в форме
+    комментария - CSRF-токен его cookie (после входа он другой).
+    """
+    if not hasattr(request, '_post_validators'):
+        row = Post.objects.filter(pk=post_id).annotate(
+            last_comment=Subquery(
+                Comment.objects.filter(post=OuterRef('pk')).order_by(
+                    '-pub_date'
+                ).values('pub_date')[:1]
+            )
+        ).values_list(
+            'updated_at', 'last_comment', 'author_id', 'author__username',
+            'group_id'
+        ).first()
+        request._post_validators = None, None
+        if row is not None:
+            updated_at, last_comment, author_id, username, group_id = row
+            versions = cards.get_versions([
+                ('post', post_id), ('user', author_id),
+                ('group', group_id), ('comments', post_id),
+            ])
+            etag = hashlib.md5('|'.join([
+                str(post_id), updated_at.isoformat(),
+                *sorted(versions.values()),
+                *tag_versions([f'profile:{username}']),
+                str(request.user.pk or 0), csrf_cookie(request),
+            ]).encode()).hexdigest()
+            request._post_validators = etag, max(
+                filter(None, [updated_at, last_comment])
+            )
+    return request._post_validators
+
+
+@cache_control(no_cache=True)
+@condition(
+    etag_func=lambda request, post_id: post_validators(request, post_id)[0],
+    last_modified_func=lambda request, post_id: post_validators(
+        request, post_id
+    )[1]
+)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__profile', 'group'), pk=post_id
+    )
+    counters.ensure_profile(post.author)
     form = CommentForm()
+    comments = comment_page(request, post)
+    reply_to = request.GET.get('reply', '')
     context = {
         'post': post,
-        'form': form
+        'form': form,
+        'comments': comments,
+        # С самого нового из показанных страница спрашивает новые.
+        'comments_since': comments.paginator.encode(max(
+            comments, key=lambda comment: (comment.pub_date, comment.pk)
+        )) if comments else '',
+        'reply_to': int(reply_to) if reply_to.isdigit() else None,
+    }
+    return render(request, template, context)
+
+
+def post_comments(request, post_id):
+    template = 'posts/comments.html'
+    post = get_object_or_404(Post, pk=post_id)
+    context = {
+        'post': post,
+        'comments': comment_page(request, post),
     }
     return render(request, template, context)
 
@@ -65,12 +272,14 @@ def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None
+        files=request.FILES or None,
+        upload_errors=getattr(request, 'upload_errors', None)
     )
     if form.is_valid():
         new_form = form.save(commit=False)
         new_form.author = request.user
         new_form.save()
+        thumbnails.enqueue(new_form)
         return redirect('posts:profile', new_form.author)
     context = {
         'form': form
@@ -86,10 +295,13 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        upload_errors=getattr(request, 'upload_errors', None)
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.enqueue(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -99,24 +311,109 @@ def post_edit(request, post_id):
     return render(request, template, context)
 
 
+def comment_thread(request, post_id, comment_id):
+    template = 'posts/comments.html'
+    comment = get_object_or_404(Comment, pk=comment_id, post_id=post_id)
+    context = {
+        'post': comment.post,
+        'comments': subtree(comment),
+    }
+    return render(request, template, context)
+
+
+def comments_etag(request, post_id):
+    # Состояние комментариев поста из базы - один агрегат по индексу
+    # поста: число меняют удаления, время правки - новые и правленые.
+    # Версия из кэша тут не годится: кэш процесса не видит чужих
+    # комментариев. Формат, курсор и вход (кнопка ответа во фрагменте)
+    # дают разные ответы.
+    state = Comment.objects.filter(post_id=post_id).aggregate(
+        count=Count('pk'), updated=Max('updated_at')
+    )
+    return hashlib.md5('|'.join([
+        str(post_id), str(state['count']), str(state['updated']),
+        request.GET.get('format', ''),
+        request.GET.get('since', ''),
+        str(int(request.user.is_authenticated)),
+    ]).encode()).hexdigest()
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=comments_etag)
+def new_comments(request, post_id):
+    """Комментарии после курсора since: HTML-фрагмент или ?format=json."""
+    post = get_object_or_404(Post, pk=post_id)
+    since = request.GET.get('since')
+    paginator = CursorPaginator(
+        post.comments.select_related('author'), settings.COMMENTS_PER_PAGE
+    )
+    page_obj = paginator.get_page_since(since)
+    if page_obj.object_list:
+        since = paginator.encode(page_obj.object_list[-1])
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'author_url': reverse(
+                        'posts:profile', args=[comment.author.username]
+                    ),
+                    'text': comment.text,
+                    'pub_date': comment.pub_date,
+                    'parent': comment.parent_id,
+                    'depth': comment.depth,
+                }
+                for comment in page_obj
+            ],
+            'since': since,
+            'has_more': page_obj.has_next(),
+        }, json_dumps_params={'ensure_ascii': False})
+    response = render(
+        request, 'posts/includes/comments.html', {'comments': page_obj}
+    )
+    response['X-Comments-Since'] = since or ''
+    response['X-Comments-More'] = int(page_obj.has_next())
+    return response
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
+    parent = None
+    if request.POST.get('parent', '').isdigit():
+        parent = get_object_or_404(
+            Comment.objects.only('path'), pk=request.POST['parent'], post=post
+        )
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        comment.parent = parent
         comment.save()
+        if request.is_ajax():
+            return render(
+                request, 'posts/includes/comment.html', {'comment': comment},
+                status=HTTPStatus.CREATED
+            )
+    elif request.is_ajax():
+        return JsonResponse(
+            {'errors': form.errors}, status=HTTPStatus.BAD_REQUEST
+        )
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@cache_tagged(lambda request: [f'follow:{request.user.pk}'])
 def follow_index(request):
     template = 'posts/follow.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
+    feed = request.user.feed.select_related('post__author', 'post__group')
+    page_obj = paginator(request, feed, id_field='post_id')
+    page_obj.object_list = [item.post for item in page_obj.object_list]
+    counters.ensure_profile(request.user)
     context = {
-        'page_obj': paginator(request, post_list),
+        'page_obj': page_obj,
     }
     return render(request, template, context)
 
@@ -139,3 +436,19 @@ def profile_unfollow(request, username):
     if follow:
         follow.delete()
     return redirect('posts:profile', username)
+
+
+def resize_image(request, signature, width, height, path, image_format=''):
+    if (
+        not resize.check_signature(
+            signature, path, width, height, image_format
+        )
+        or not resize.format_available(image_format)
+        or not 0 < width <= settings.RESIZE_MAX_DIMENSION
+        or not 0 < height <= settings.RESIZE_MAX_DIMENSION
+        or not image_storage.exists(path)
+    ):
+        raise Http404
+    return resize.serve(
+        resize.get_resized(path, width, height, image_format)
+    )
@@ -0,0 +1,106 @@
+// Комментарии на странице поста: отправка без перезагрузки и опрос новых.
+(function () {
+  var thread = document.getElementById('comments');
+  if (!thread) {
+    return;
+  }
+  var form = document.getElementById('comment-form');
+  var since = thread.dataset.since;
+  var headers = {'X-Requested-With': 'XMLHttpRequest'};
+  var POLL_INTERVAL = 15000;
+
+  // Ответ опроса может повторить уже показанные комментарии, а ответы
+  // на ветки, которых нет на странице, показывать негде.
+  function append(html) {
+    var fragment = document.createElement('template');
+    fragment.innerHTML = html;
+    Array.prototype.forEach.call(fragment.content.children, function (node) {
+      var parent = node.dataset.parent;
+      if (document.getElementById(node.id) ||
+          (parent && !document.getElementById('comment-' + parent))) {
+        return;
+      }
+      // Порядок path - порядок обхода веток.
+      var next = Array.prototype.find.call(thread.children, function (child) {
+        return child.dataset.path > node.dataset.path;
+      });
+      thread.insertBefore(node.cloneNode(true), next || null);
+    });
+  }
+
+  function poll() {
+    var url = thread.dataset.newUrl;
+    if (since) {
+      url += '?since=' + encodeURIComponent(since);
+    }
+    fetch(url, {headers: headers, credentials: 'same-origin'})
+      .then(function (response) {
+        if (!response.ok) {
+          return;
+        }
+        since = response.headers.get('X-Comments-Since') || since;
+        var more = response.headers.get('X-Comments-More') === '1';
+        return response.text().then(function (html) {
+          append(html);
+          return more;
+        });
+      })
+      .then(function (more) {
+        setTimeout(poll, more ? 0 : POLL_INTERVAL);
+      }, function () {
+        setTimeout(poll, POLL_INTERVAL);
+      });
+  }
+
+  if (form) {
+    thread.addEventListener('click', function (event) {
+      var link = event.target.closest('[data-reply]');
+      if (link) {
+        event.preventDefault();
+        form.elements.parent.value = link.dataset.reply;
+        form.elements.text.focus();
+      }
+    });
+
+    var errors = document.getElementById('comment-errors');
+
+    function showErrors(fields) {
+      errors.textContent = '';
+      Object.keys(fields).forEach(function (name) {
+        fields[name].forEach(function (message) {
+          var line = document.createElement('div');
+          line.textContent = message;
+          errors.appendChild(line);
+        });
+      });
+    }
+
+    // Ошибки формы показываем у поля; прочие сбои (403 после смены
+    // CSRF-токена, сеть) - обычной отправкой, чтобы ответил сервер.
+    form.addEventListener('submit', function (event) {
+      event.preventDefault();
+      fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: headers,
+        credentials: 'same-origin'
+      }).then(function (response) {
+        if (response.status === 201) {
+          form.reset();
+          form.elements.parent.value = '';
+          showErrors({});
+          return response.text().then(append);
+        }
+        if (response.status === 400) {
+          return response.json().then(function (data) {
+            showErrors(data.errors);
+          });
+        }
+        form.submit();
+      }, function () {
+        form.submit();
+      });
+    });
+  }
+  setTimeout(poll, POLL_INTERVAL);
+})();
@@ -1,3 +1,10 @@
-# from django.contrib import admin
+from django.contrib import admin
+from .models import Profile
 
-# Register your models here.
+
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'post_count', 'follower_count', 'following_count')
+    search_fields = ('user__username',)
+
+
+admin.site.register(Profile, ProfileAdmin)
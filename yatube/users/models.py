@@ -1,3 +1,33 @@
-# from django.db import models
+from django.contrib.auth import get_user_model
+from django.db import models
 
-# Create your models here.
+User = get_user_model()
+
+
+class Profile(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='profile'
+    )
+    post_count = models.PositiveIntegerField(
+        verbose_name='Постов',
+        default=0
+    )
+    follower_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Подписок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+    def __str__(self):
+        return str(self.user)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,7 +65,7 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.timing.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -144,15 +146,129 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# the default cache must be shared by all workers: tag invalidation,
+# card versions and the thumbnail queue work through it (LocMemCache is
+# per process, see core.checks); on several hosts use Redis or Memcached
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 100000, 'MAX_SIZE': 256 * 1024 * 1024},
+    },
+    'thumbnails': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'LOCATION': 'thumbnails',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
+# sorl-thumbnail key-value store: cache first, database on a miss, with
+# batched lookups for whole pages; only found rows are cached, so a
+# per-process cache still sees thumbnails written by the worker
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_CACHE = 'thumbnails'
+
+# the first handler stops an upload as soon as it exceeds
+# POST_IMAGE_MAX_BYTES instead of spooling it to disk
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 # Constats
 
 # number of posts per page, min=2
 POSTS_PER_PAGE = 10
+
+# comments on a post page; earlier ones are at /posts/<id>/comments/
+COMMENTS_PER_PAGE = 20
+
+# replies shown under each thread on a post page; the rest are behind a
+# link to the thread
+COMMENT_REPLIES_PER_THREAD = 50
+
+# keyset pagination (?after=/?before=) for all post lists by default
+POSTS_CURSOR_PAGINATION = False
+
+# number of feed items written per bulk insert
+FEED_BATCH_SIZE = 500
+
+# lifetime of a cached post card, seconds
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# cached pages are invalidated by tags; after PAGE_CACHE_TIMEOUT seconds
+# a page is stale and is rebuilt by one request while others get the old
+# copy, after PAGE_CACHE_HARD_TIMEOUT seconds it is dropped
+PAGE_CACHE_TIMEOUT = 60 * 60 * 12
+PAGE_CACHE_HARD_TIMEOUT = 60 * 60 * 24
+# how long a rebuild may hold its lock and how long other requests wait
+# for a page nobody has cached yet, seconds
+PAGE_CACHE_LOCK_TIMEOUT = 30
+PAGE_CACHE_LOCK_WAIT = 2
+# rebuild stale anonymous pages in a background thread instead of the
+# request (pages of logged-in users are always rebuilt in the request)
+PAGE_CACHE_BACKGROUND_REFRESH = False
+
+# limits of uploaded post images: size in bytes is checked while the
+# upload streams in, pixels are checked from the header before decoding
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+# re-encode uploaded originals in the thumbnail workers: metadata is
+# stripped, the longest side is capped, format is a progressive 'JPEG'
+# or 'WEBP'
+POST_IMAGE_REENCODE = True
+POST_IMAGE_MAX_DIMENSION = 2560
+POST_IMAGE_FORMAT = 'JPEG'
+
+# thumbnail geometries of post images and their sorl options
+POST_THUMBNAILS = {
+    '960x339': {'crop': 'center', 'upscale': True},
+}
+# widths of the srcset copies of post images (in the thumbnail's aspect
+# ratio), their sizes attribute and whether to add WebP copies
+POST_IMAGE_WIDTHS = [320, 640, 960]
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+POST_IMAGE_WEBP = False
+# generate thumbnails in `manage.py generate_thumbnails` workers instead of
+# the request; until then templates show the original image
+POST_THUMBNAILS_ASYNC = True
+THUMBNAIL_TASK_ATTEMPTS = 3
+# seconds after which a running task of a dead worker is requeued
+THUMBNAIL_TASK_TIMEOUT = 300
+
+# signed on-the-fly resizing at MEDIA_URL/resize/<sig>/<w>x<h>/<path>;
+# copies are kept on disk up to RESIZE_CACHE_MAX_SIZE bytes, least
+# recently read are evicted at most once per RESIZE_CACHE_CULL_INTERVAL
+RESIZE_CACHE_ROOT = os.path.join(BASE_DIR, 'cache', 'resize')
+RESIZE_CACHE_MAX_SIZE = 512 * 1024 * 1024
+RESIZE_CACHE_CULL_INTERVAL = 60
+RESIZE_MAX_DIMENSION = 2048
+# internal nginx location aliased to RESIZE_CACHE_ROOT, e.g. '/resized/';
+# empty - files are sent by the WSGI server's file_wrapper
+RESIZE_ACCEL_REDIRECT = ''
+
+# /api/autocomplete/?q= answers from usernames and group slugs kept in
+# memory of every worker; the compact index stores them as one byte
+# string (a few bytes per name instead of ~100) for very large sites
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_COMPACT = False
+# changes collected before they are merged into the compact index
+AUTOCOMPLETE_COMPACT_MERGE = 1000
+
+# core.timing.ServerTimingMiddleware logs SQL, template, cache and thumbnail
+# timings of every request to the 'core.timing' logger and, if enabled,
+# returns them in the Server-Timing header (visible to anyone: it tells how
+# long SQL takes, so it may be switched off on public sites)
+SERVER_TIMING_HEADER = True
+
+# /metrics (staff or 'Authorization: Bearer <METRICS_TOKEN>') sums the
+# per-process files that every worker rewrites in METRICS_DIR at most once
+# per METRICS_FLUSH_INTERVAL seconds; all workers must share the directory,
+# and it should be emptied when the site is redeployed
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+METRICS_FLUSH_INTERVAL = 1
+METRICS_TOKEN = ''